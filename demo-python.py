@@ -13,6 +13,7 @@ print("Ilość dróg rowerowych:", len(cycleways))
 import osmnx as ox
 import json
 import random
+import numpy as np
 
 bike_type = "szosowy"
 
@@ -36,28 +37,39 @@ dest = ox.nearest_nodes(G, end_lon, end_lat)
 
 path = ox.shortest_path(G, orig, dest, weight="length")
 
-nodes, edges = ox.graph_to_gdfs(G)
+#współrzędne węzłów jako tablica - bez budowania GeoDataFrame dla całego grafu
+node_row = {node: row for row, node in enumerate(G.nodes)}
+node_xy = np.array([(data["x"], data["y"]) for _, data in G.nodes(data=True)])
 
 
-#wyciąganie krawędzi i trasy
-route_edges = []
-route_length = 0
-surfaces_on_route = set()
+#atrybuty krawędzi jako tablice kolumnowe + (u, v) -> indeks krawędzi
+#graf multi-edge -> wybieramy pierwszy wariant (najmniejszy klucz)
+first_edge = {}
+for u, v, key, data in G.edges(keys=True, data=True):
+    if (u, v) not in first_edge or key < first_edge[(u, v)][0]:
+        first_edge[(u, v)] = (key, data)
 
-for u, v in zip(path[:-1], path[1:]):
-    edge_data = G.get_edge_data(u, v)
+edge_index = {edge: row for row, edge in enumerate(first_edge)}
+edge_length = np.array([data.get("length", 0) for _, data in first_edge.values()], dtype=np.float64)
 
-    # graf multi-edge -> wybieramy pierwszy wariant
-    edge = edge_data[min(edge_data.keys())]
+surface_codes = {}  # nawierzchnia (lista jako krotka) -> kod
+edge_surface = np.array([
+    surface_codes.setdefault(tuple(s) if isinstance(s, list) else s, len(surface_codes))
+    for s in (data.get("surface", "unknown") for _, data in first_edge.values())
+], dtype=np.int32)
+surface_values = list(surface_codes)
 
-    route_edges.append(edge)
+#wyciąganie trasy - długość i nawierzchnie jednym odczytem z tablic
+route_edge_rows = np.array([edge_index[(u, v)] for u, v in zip(path[:-1], path[1:])], dtype=np.int64)
 
-    # długość - tym razem działa i działa dobrze xddd
-    route_length += edge.get("length", 0)
+# długość - tym razem działa i działa dobrze xddd
+route_length = float(edge_length[route_edge_rows].sum())
 
-    #nawierzchnia
-    surface = edge.get("surface", "unknown")
-    if isinstance(surface, list):
+#nawierzchnia
+surfaces_on_route = set()
+for code in np.unique(edge_surface[route_edge_rows]):
+    surface = surface_values[code]
+    if isinstance(surface, tuple):
         surfaces_on_route.update(surface)
     else:
         surfaces_on_route.add(surface)
@@ -81,7 +93,7 @@ else:
     print(f"✅ Trasa jest odpowiednia dla roweru typu: {bike_type}")
 
 
-route_coords = [(nodes.loc[node].x, nodes.loc[node].y) for node in path]
+route_coords = node_xy[[node_row[node] for node in path]].tolist()
 
 geojson = {
     "type": "FeatureCollection",
@@ -104,6 +116,8 @@ with open("route_chorzow.geojson", "w") as f:
 
 
 ----------------------------------------------------------------------
+import os
+import json
 import requests
 import geopandas as gpd
 from shapely.geometry import LineString
@@ -118,9 +132,17 @@ area["name"="Chorzów"]->.searchArea;
 out geom;
 """
 
-url = "https://overpass-api.de/api/interpreter"
-response = requests.get(url, params={'data': query})
-data = response.json()
+# Lokalny zamiennik Overpass: drogi rowerowe zapisane przy wczytywaniu wyciągu OSM
+# (python demo-python.py ingest slaskie.osm.pbf --name chorzow) - wtedy nie potrzeba sieci
+local_cycleways = os.path.join("graph_store", "region_chorzow", "cycleways.json")
+
+if os.path.exists(local_cycleways):
+    with open(local_cycleways, "r", encoding="utf-8") as f:
+        data = json.load(f)
+else:
+    url = "https://overpass-api.de/api/interpreter"
+    response = requests.get(url, params={'data': query})
+    data = response.json()
 
 elements = [e for e in data["elements"] if e["type"] == "way"]
 
@@ -153,24 +175,192 @@ print(gdf["surface"].value_counts(dropna=False))
 
 ------------------------------------------------------------------
 
-import osmnx as ox
 import json
 import math
+import os
+import shutil
+import argparse
+import weakref
+import multiprocessing
+import sys
+import csv
+import contextlib
+import asyncio
+import concurrent.futures
+import urllib.parse
+import re
+import bz2
+import gzip
+import xml.etree.ElementTree as ET
+import hashlib
+import time
+import platform
+import random
+import tracemalloc
+import tempfile
+import functools
+import importlib
+import cProfile
+import pstats
+import io
+from collections import OrderedDict
+import numpy as np
 import networkx as nx
-from typing import List, Tuple, Dict
-import matplotlib.pyplot as plt
+from typing import List, Tuple, Dict, Iterator, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from scipy.spatial import cKDTree
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class _LazyModule:
+    """
+    Moduł importowany dopiero przy pierwszym odwołaniu do jego atrybutu. Sam import osmnx
+    (z sklearn, scipy.stats itd.) trwa ponad sekundę, a trasa z zapisanego grafu go nie potrzebuje.
+    configure(moduł) wywoływane jest raz, zaraz po imporcie.
+    """
+
+    def __init__(self, name: str, configure=None):
+        self._name = name
+        self._configure = configure
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+            if self._configure is not None:
+                self._configure(self._module)
+        return getattr(self._module, attr)
+
+def _configure_osmnx(module):
+    # Nawierzchnia jest potrzebna przy wyznaczaniu tras dla typu roweru - osmnx domyślnie jej nie zachowuje
+    module.settings.useful_tags_way = list(dict.fromkeys(list(module.settings.useful_tags_way) + ["surface"]))
+    overpass_cache.install(module)
+
+ox = _LazyModule("osmnx", _configure_osmnx)
+
+# Pomiary czasu etapów - przy wyłączonym profilerze span() to tylko sprawdzenie flagi
+_NO_SPAN = contextlib.nullcontext()
+
+class StageProfiler:
+    """
+    Zbiera odcinki czasu (spans) etapów generowania trasy: sumy i liczbę wywołań dla każdej
+    nazwy oraz (do max_spans) pojedyncze odcinki do zapisu jako ślad JSONL.
+    """
+
+    def __init__(self, max_spans: int = 100_000):
+        self.enabled = False
+        self.max_spans = max_spans
+        self.reset()
+
+    def reset(self):
+        self.spans = []
+        self.totals = {}  # nazwa -> [liczba wywołań, sekundy]
+        self._depth = 0
+
+    def span(self, name: str):
+        if not self.enabled:
+            return _NO_SPAN
+        return self._record(name)
+
+    @contextlib.contextmanager
+    def _record(self, name: str):
+        started_at = time.time()
+        started = time.perf_counter()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            seconds = time.perf_counter() - started
+            total = self.totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+            if len(self.spans) < self.max_spans:
+                self.spans.append({'name': name, 'start': started_at, 'seconds': seconds, 'depth': self._depth})
+
+    def merge_totals(self, totals: Dict):
+        """
+        Dolicza sumy z innego procesu (np. procesu roboczego serwera).
+        """
+        for name, (count, seconds) in totals.items():
+            total = self.totals.setdefault(name, [0, 0.0])
+            total[0] += count
+            total[1] += seconds
+
+    def write_trace(self, path: str, spans: List[Dict] = None, **fields):
+        """
+        Dopisuje odcinki do pliku JSONL (jeden odcinek na linię, z dodatkowymi polami).
+        """
+        with open(path, "a", encoding='utf-8') as f:
+            for span in self.spans if spans is None else spans:
+                f.write(json.dumps(dict(span, **fields), ensure_ascii=False) + "\n")
+
+profiler = StageProfiler()
+
+def profiled(name: str):
+    """
+    Dekorator: całe wywołanie funkcji jako odcinek o podanej nazwie.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return fn(*args, **kwargs)
+            with profiler.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def prometheus_metrics(totals: Dict, requests: Dict = None) -> str:
+    """
+    Sumy czasów etapów (i liczniki zapytań HTTP) w formacie tekstowym Prometheusa.
+    """
+    lines = [
+        "# HELP route_stage_seconds Czas etapów generowania tras",
+        "# TYPE route_stage_seconds summary",
+    ]
+    for name, (count, seconds) in sorted(totals.items()):
+        lines.append(f'route_stage_seconds_sum{{stage="{name}"}} {seconds:.6f}')
+        lines.append(f'route_stage_seconds_count{{stage="{name}"}} {count}')
+    if requests is not None:
+        lines += ["# HELP route_http_requests_total Liczba zapytań HTTP", "# TYPE route_http_requests_total counter"]
+        for (path, status), count in sorted(requests.items()):
+            lines.append(f'route_http_requests_total{{path="{path}",status="{status}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+def profile_call(fn, *args, limit: int = 30, **kwargs) -> Tuple:
+    """
+    Wywołuje fn pod cProfile. Zwraca (wynik, tekst z najdroższymi funkcjami wg czasu łącznego).
+    """
+    profile = cProfile.Profile()
+    result = profile.runcall(fn, *args, **kwargs)
+    report = io.StringIO()
+    pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(limit)
+    return result, report.getvalue()
 
 def calculate_square_corners(start_lon: float, start_lat: float, side_length: float) -> List[Tuple[float, float]]:
     """
     Oblicza wierzchołki kwadratu o podanej długości boku.
     """
+    return calculate_polygon_corners(start_lon, start_lat, side_length, sides=4, rotation=0.0)
+
+def calculate_polygon_corners(start_lon: float, start_lat: float, side_length: float,
+                              sides: int = 4, rotation: float = 0.0) -> List[Tuple[float, float]]:
+    """
+    Oblicza wierzchołki wielokąta foremnego o podanej długości boku, zaczynając od punktu startowego.
+    rotation obraca kierunek pierwszego boku (w stopniach, zgodnie z ruchem wskazówek zegara).
+    """
     R = 6371000  # Promień Ziemi w metrach
 
     corners = []
     current_lon, current_lat = start_lon, start_lat
 
-    # Kierunki: północ → wschód → południe → zachód
-    bearings = [0, 90, 180, 270]
+    # Kierunki kolejnych boków (dla kwadratu bez obrotu: północ → wschód → południe → zachód)
+    bearings = [rotation + i * 360 / sides for i in range(sides)]
 
     for bearing in bearings:
         corners.append((current_lon, current_lat))
@@ -212,82 +402,1523 @@ def calculate_square_dimensions(target_route_length: float, proportion_denominat
 
     return square_perimeter, side_length
 
-def find_circular_route(G, corners: List[Tuple[float, float]]) -> List[int]:
+# Proporcje długość trasy : obwód kwadratu sprawdzane dla każdej trasy
+DEFAULT_PROPORTIONS = [
+    (7.0, "10:7"),
+    (6.5, "10:6.5"),
+    (6.0, "10:6")
+]
+
+def calculate_search_radius(target_route_length: float,
+                            proportions: List[Tuple[float, str]] = DEFAULT_PROPORTIONS) -> float:
     """
-    Znajduje okrężną trasę przez wszystkie wierzchołki bez powtarzania ścieżek.
+    Promień obszaru, który musi obejmować graf (największy kwadrat + 50% zapasu).
     """
-    # Znajdź najbliższe węzły dla każdego wierzchołka
-    corner_nodes = []
-    for lon, lat in corners:
-        node = ox.nearest_nodes(G, lon, lat)
-        corner_nodes.append(node)
+    max_side_length = calculate_square_dimensions(target_route_length, min(p[0] for p in proportions))[1]
+    return max_side_length * 1.5
 
-    # Znajdź ścieżki między kolejnymi wierzchołkami
-    route_segments = []
-    used_edges = set()
+def haversine_distance(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    """
+    Odległość po kole wielkim między dwoma punktami (w metrach).
+    """
+    R = 6371000  # Promień Ziemi w metrach
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * R * math.asin(math.sqrt(a))
 
-    for i in range(len(corner_nodes)):
-        start_node = corner_nodes[i]
-        end_node = corner_nodes[(i + 1) % len(corner_nodes)]
+class CandidatePruned(Exception):
+    """
+    Kandydat na pewno jest dłuższy niż dopuszczalna długość - dalsze wyznaczanie trasy nie ma sensu.
+    """
 
-        # Znajdź najkrótszą ścieżkę unikając już użytych krawędzi
+    def __init__(self, lower_bound: float):
+        super().__init__(f"Dolne ograniczenie długości trasy: {lower_bound:.0f} m")
+        self.lower_bound = lower_bound
+
+class CircularRoute:
+    """
+    Trasa okrężna zapamiętana bok po boku: węzły każdego boku, jego krawędzie i długość.
+    Bok k prowadzi z wierzchołka k do k+1. Po przesunięciu jednego wierzchołka przeliczane są
+    tylko dwa sąsiednie boki, a zbiór zajętych krawędzi i długość całkowita zmieniają się o różnicę.
+    """
+
+    def __init__(self, G, corner_nodes: List[int], max_length: float = None, bike_type: str = None,
+                 length_bounds: List[float] = None):
+        """
+        Wyznacza wszystkie boki po kolei - każdy omija krawędzie boków wcześniejszych.
+        Przy podanym max_length rzuca CandidatePruned (patrz find_circular_route),
+        a przy braku ścieżki - nx.NetworkXNoPath.
+        Do listy length_bounds (jeśli podana) dopisywane są kolejne sprawdzane dolne ograniczenia
+        długości - także wtedy, gdy trasy nie udało się dokończyć.
+        """
+        self.G = G
+        self.bike_type = bike_type
+        self.corner_nodes = list(corner_nodes)
+        self.segments = [None] * len(self.corner_nodes)
+        self.segment_edges = [set() for _ in self.corner_nodes]
+        self.segment_lengths = [0.0] * len(self.corner_nodes)
+        self.total_length = 0.0
+        self._edge_usage = {}  # krawędź (u, v) -> liczba boków, które z niej korzystają
+
+        # Dolne ograniczenia długości boków: żadna droga nie jest krótsza niż odcinek po kole wielkim
+        side_bounds = [self._side_bound(k) for k in range(len(self.corner_nodes))]
+        if length_bounds is not None:
+            length_bounds.append(sum(side_bounds))
+        if max_length is not None and sum(side_bounds) > max_length:
+            raise CandidatePruned(sum(side_bounds))
+
+        for k in range(len(self.corner_nodes)):
+            self._route_side(k)
+            # Przerwij, jeśli kandydat nie ma już szans być lepszy od najlepszego
+            lower_bound = self.total_length + sum(side_bounds[k + 1:])
+            if length_bounds is not None:
+                length_bounds.append(lower_bound)
+            if max_length is not None and lower_bound > max_length:
+                raise CandidatePruned(lower_bound)
+
+    def _side_bound(self, k: int) -> float:
+        node_row, coords = get_node_coordinates(self.G)
+        a = coords[node_row[self.corner_nodes[k]]]
+        b = coords[node_row[self.corner_nodes[(k + 1) % len(self.corner_nodes)]]]
+        return haversine_distance(a[0], a[1], b[0], b[1])
+
+    def _route_side(self, k: int):
+        """
+        Wyznacza bok k omijając krawędzie pozostałych (już wyznaczonych) boków.
+        """
+        start_node = self.corner_nodes[k]
+        end_node = self.corner_nodes[(k + 1) % len(self.corner_nodes)]
+        # Tylko punkt startu powtarza się we wszystkich kandydatach - dla niego opłaca się drzewo
+        # najkrótszych ścieżek (pierwszy bok: "od startu", ostatni: "do startu"), ograniczone
+        # do obwodu trasy. Pozostałe boki szukane są bezpośrednio między wierzchołkami.
+        tree_root, tree_cutoff = None, None
+        if k == 0 or k == len(self.corner_nodes) - 1:
+            tree_root = 'source' if k == 0 else 'target'
+            tree_cutoff = sum(self._side_bound(j) for j in range(len(self.corner_nodes)))
         try:
-            segment = find_path_avoiding_edges(G, start_node, end_node, used_edges)
-            if segment:
-                route_segments.extend(segment[:-1])  # Bez ostatniego (będzie pierwszym następnego)
-                # Dodaj użyte krawędzie do zbioru
-                for u, v in zip(segment[:-1], segment[1:]):
-                    used_edges.add((u, v))
-                    used_edges.add((v, u))  # Dodaj też w przeciwnym kierunku
+            segment = find_path_avoiding_edges(self.G, start_node, end_node, self._edge_usage,
+                                               tree_root=tree_root, tree_cutoff=tree_cutoff,
+                                               bike_type=self.bike_type)
+        except nx.NetworkXNoPath:
+            raise nx.NetworkXNoPath(f"{k} i {(k + 1) % len(self.corner_nodes)}")
+        edges = set()
+        for u, v in zip(segment[:-1], segment[1:]):
+            edges.add((u, v))
+            edges.add((v, u))  # Dodaj też w przeciwnym kierunku
+        for edge in edges:
+            self._edge_usage[edge] = self._edge_usage.get(edge, 0) + 1
+
+        self.segments[k] = segment
+        self.segment_edges[k] = edges
+        self.segment_lengths[k] = calculate_route_length(self.G, segment)
+        self.total_length += self.segment_lengths[k]
+
+    def _remove_side(self, k: int):
+        removed = (self.segments[k], self.segment_edges[k], self.segment_lengths[k])
+        for edge in self.segment_edges[k]:
+            count = self._edge_usage[edge] - 1
+            if count:
+                self._edge_usage[edge] = count
             else:
-                print(f"Ostrzeżenie: Nie znaleziono ścieżki między wierzchołkami {i} i {(i+1)%len(corner_nodes)}")
-                return []
-
+                del self._edge_usage[edge]
+        self.total_length -= self.segment_lengths[k]
+        self.segments[k] = None
+        self.segment_edges[k] = set()
+        self.segment_lengths[k] = 0.0
+        return removed
+
+    def _restore_side(self, k: int, side):
+        self.segments[k], self.segment_edges[k], self.segment_lengths[k] = side
+        for edge in self.segment_edges[k]:
+            self._edge_usage[edge] = self._edge_usage.get(edge, 0) + 1
+        self.total_length += self.segment_lengths[k]
+
+    def set_corner_node(self, index: int, node: int) -> float:
+        """
+        Zmienia węzeł wierzchołka i przelicza tylko dwa boki, które się w nim stykają.
+        Zwraca nową długość trasy. Gdy nowego wierzchołka nie da się połączyć,
+        rzuca nx.NetworkXNoPath i zostawia trasę bez zmian.
+        """
+        if node == self.corner_nodes[index]:
+            return self.total_length
+
+        previous_node, self.corner_nodes[index] = self.corner_nodes[index], node
+        previous_side = (index - 1) % len(self.corner_nodes)
+        affected = [previous_side, index] if previous_side != index else [index]
+        removed = [self._remove_side(k) for k in affected]
+        try:
+            for k in affected:
+                self._route_side(k)
         except nx.NetworkXNoPath:
-            print(f"Błąd: Brak ścieżki między wierzchołkami {i} i {(i+1)%len(corner_nodes)}")
-            return []
+            for k, side in zip(affected, removed):
+                if self.segments[k] is not None:
+                    self._remove_side(k)
+                self._restore_side(k, side)
+            self.corner_nodes[index] = previous_node
+            raise
+        return self.total_length
+
+    def move_corner(self, index: int, lon: float, lat: float) -> float:
+        """
+        Przesuwa wierzchołek do punktu (przyciągniętego do grafu). Zwraca nową długość trasy.
+        """
+        return self.set_corner_node(index, snap_points_to_nodes(self.G, [(lon, lat)])[0])
+
+    def nodes(self) -> List[int]:
+        """
+        Węzły całej trasy od pierwszego wierzchołka, z powrotem do punktu startu.
+        """
+        route = []
+        for segment in self.segments:
+            route.extend(segment[:-1])  # Bez ostatniego (będzie pierwszym następnego)
+        route.append(route[0] if route else self.corner_nodes[0])
+        return route
+
+@profiled("route")
+def find_circular_route(G, corners: List[Tuple[float, float]], corner_nodes: List[int] = None,
+                        max_length: float = None, bike_type: str = None,
+                        length_bounds: List[float] = None) -> List[int]:
+    """
+    Znajduje okrężną trasę przez wszystkie wierzchołki bez powtarzania ścieżek.
+    corner_nodes pozwala podać węzły wierzchołków przyciągnięte wcześniej (np. hurtowo).
+    Przy podanym max_length rzuca CandidatePruned, gdy już wyznaczone boki plus odległości
+    w linii prostej między pozostałymi wierzchołkami przekraczają max_length.
+    bike_type wybiera koszty krawędzi zależne od nawierzchni (patrz get_bike_edge_costs).
+    length_bounds zbiera kolejne dolne ograniczenia długości (patrz CircularRoute).
+    Do późniejszej edycji trasy (przesuwanie wierzchołków) służy bezpośrednio CircularRoute.
+    """
+    # Znajdź najbliższe węzły dla każdego wierzchołka
+    if corner_nodes is None:
+        corner_nodes = snap_points_to_nodes(G, corners)
 
-    # Dodaj ostatni węzeł aby zamknąć pętlę
-    route_segments.append(route_segments[0])
+    try:
+        return CircularRoute(G, corner_nodes, max_length, bike_type, length_bounds).nodes()
+    except nx.NetworkXNoPath as e:
+        print(f"Błąd: Brak ścieżki między wierzchołkami {e}")
+        return []
 
-    return route_segments
+class ShortestPathTreeCache:
+    """
+    Pamięć podręczna drzew najkrótszych ścieżek (Dijkstra z jednego źródła) z wypieraniem LRU.
+    Rozmiar jest ograniczony łączną liczbą węzłów we wszystkich zapamiętanych drzewach.
+    Drzewa "do celu" liczone są na odwróconym grafie.
+    Drzewo może być ograniczone do kosztu cutoff - dla węzłów w jego zasięgu ścieżki są nadal
+    najkrótsze, a dalsze węzły traktowane są jak brak trafienia.
+    Osobne drzewa są trzymane dla każdego typu roweru (liczone na widoku bike_graph_view).
+    """
 
-def find_path_avoiding_edges(G, start_node: int, end_node: int, forbidden_edges: set) -> List[int]:
+    def __init__(self, max_nodes: int = 2_000_000):
+        self.max_nodes = max_nodes
+        self.hits = 0
+        self.misses = 0
+        self._trees = OrderedDict()  # (kierunek, węzeł, typ roweru) -> ({węzeł: poprzednik}, cutoff)
+        self._size = 0
+
+    def _get(self, tree_key, node: int, cutoff: float = None):
+        """
+        Zwraca zapamiętane drzewo zawierające node. Drzewo ograniczone mniejszym cutoff,
+        w którym node się nie mieści, jest pomijane (None) - można je zbudować od nowa.
+        """
+        entry = self._trees.get(tree_key)
+        if entry is None:
+            return None
+        tree, tree_cutoff = entry
+        if node not in tree and tree_cutoff is not None and (cutoff is None or cutoff > tree_cutoff):
+            return None
+        self._trees.move_to_end(tree_key)
+        return tree
+
+    def _build(self, G, tree_key, cutoff: float = None):
+        direction, root, bike_type = tree_key
+        graph = bike_graph_view(G, bike_type)
+        graph = graph if direction == 'from' else graph.reverse(copy=False)
+        weight = 'length'
+        if bike_type is not None:
+            # W odwróconym grafie krawędź (u, v) to oryginalna krawędź (v, u)
+            costs = get_bike_edge_costs(G, bike_type, passable_only=True)
+            weight = ((lambda u, v, _: costs.get((u, v))) if direction == 'from'
+                      else (lambda u, v, _: costs.get((v, u))))
+        pred, _ = nx.dijkstra_predecessor_and_distance(graph, root, cutoff=cutoff, weight=weight)
+        # Zapamiętujemy tylko pierwszego poprzednika - wystarcza do odtworzenia ścieżki
+        tree = {node: preds[0] for node, preds in pred.items() if preds}
+        tree[root] = None
+
+        previous = self._trees.pop(tree_key, None)
+        if previous is not None:
+            self._size -= len(previous[0])
+        self._trees[tree_key] = (tree, cutoff)
+        self._size += len(tree)
+        while self._size > self.max_nodes and len(self._trees) > 1:
+            _, (evicted, _) = self._trees.popitem(last=False)
+            self._size -= len(evicted)
+        return tree
+
+    @staticmethod
+    def _walk(tree, node) -> List[int]:
+        path = [node]
+        while tree[node] is not None:
+            node = tree[node]
+            path.append(node)
+        return path
+
+    def path(self, G, source: int, target: int, tree_root: str = None,
+             bike_type: str = None, cutoff: float = None) -> List[int]:
+        """
+        Zwraca najkrótszą ścieżkę source -> target z zapamiętanego drzewa albo None
+        (brak drzewa, target poza jego zasięgiem lub nieosiągalny).
+        tree_root ('source' lub 'target') wskazuje węzeł, dla którego brakujące drzewo należy
+        zbudować (ograniczone do cutoff) - tylko dla węzłów powtarzających się w wielu zapytaniach.
+        """
+        from_tree = self._get(('from', source, bike_type), target, cutoff)
+        to_tree = self._get(('to', target, bike_type), source, cutoff)
+        if from_tree is None and to_tree is None:
+            self.misses += 1
+            if tree_root == 'target':
+                to_tree = self._build(G, ('to', target, bike_type), cutoff)
+            elif tree_root == 'source':
+                from_tree = self._build(G, ('from', source, bike_type), cutoff)
+            else:
+                return None
+        else:
+            self.hits += 1
+
+        if from_tree is not None and target in from_tree:
+            return self._walk(from_tree, target)[::-1]
+        if to_tree is not None and source in to_tree:
+            return self._walk(to_tree, source)
+        return None
+
+def get_path_cache(G) -> ShortestPathTreeCache:
+    cache = _graph_cache(G)
+    if 'path_cache' not in cache:
+        cache['path_cache'] = ShortestPathTreeCache()
+    return cache['path_cache']
+
+@profiled("path_search")
+def find_path_avoiding_edges(G, start_node: int, end_node: int, forbidden_edges: set,
+                             tree_root: str = None, tree_cutoff: float = None,
+                             bike_type: str = None) -> List[int]:
     """
     Znajduje ścieżkę unikającą zakazanych krawędzi.
+    Zamiast kopiować graf, zakazane krawędzie są maskowane przez funkcję wagi
+    (zwrócenie None oznacza dla networkx, że krawędzi nie ma).
+    Przy podanym bike_type szukanie odbywa się na widoku bez niedozwolonych nawierzchni
+    i minimalizuje koszt nawierzchni; gdy w widoku nie ma ścieżki, niedozwolone
+    nawierzchnie są tylko karane na pełnym grafie.
+    tree_root i tree_cutoff - patrz ShortestPathTreeCache.path.
     """
-    # Tworzymy tymczasowy graf bez zakazanych krawędzi
-    temp_G = G.copy()
+    # Najkrótsza ścieżka z zapamiętanego drzewa jest też najkrótsza z maskowaniem,
+    # o ile nie przechodzi przez żadną zakazaną krawędź
+    cached_path = get_path_cache(G).path(G, start_node, end_node, tree_root, bike_type, tree_cutoff)
+    if cached_path is not None and not any(
+            (u, v) in forbidden_edges or (v, u) in forbidden_edges
+            for u, v in zip(cached_path[:-1], cached_path[1:])):
+        return cached_path
+
+    if bike_type is None:
+        def masked_length(u, v, edge_data):
+            if (u, v) in forbidden_edges or (v, u) in forbidden_edges:
+                return None
+            # Tak samo jak weight='length' w networkx: najkrótsza z równoległych krawędzi
+            return min(attr.get('length', 1) for attr in edge_data.values())
+    else:
+        def masked_cost(costs):
+            def masked_length(u, v, edge_data):
+                if (u, v) in forbidden_edges or (v, u) in forbidden_edges:
+                    return None
+                return costs.get((u, v))
+            return masked_length
 
-    # Usuwamy zakazane krawędzie
-    for u, v in list(temp_G.edges()):
-        if (u, v) in forbidden_edges or (v, u) in forbidden_edges:
-            temp_G.remove_edge(u, v)
+        # Na widoku tylko koszty dozwolonych krawędzi, na pełnym grafie - z karą za nawierzchnię
+        masked_length = masked_cost(get_bike_edge_costs(G, bike_type))
 
-    # Znajdź najkrótszą ścieżkę w tymczasowym grafie
+    # Znajdź najkrótszą ścieżkę w oryginalnym grafie z zamaskowanymi krawędziami
     try:
-        path = nx.shortest_path(temp_G, start_node, end_node, weight='length')
+        if bike_type is not None:
+            try:
+                return shortest_path_with_index(
+                    G, start_node, end_node, weight=masked_cost(get_bike_edge_costs(G, bike_type, passable_only=True)),
+                    search_graph=bike_graph_view(G, bike_type))
+            except nx.NetworkXNoPath:
+                pass
+        path = shortest_path_with_index(G, start_node, end_node, weight=masked_length)
         return path
     except nx.NetworkXNoPath:
         # Jeśli nie ma ścieżki, spróbuj znaleźć jakąkolwiek ścieżkę w oryginalnym grafie
         print("Ostrzeżenie: Używam alternatywnej ścieżki (może powtarzać niektóre odcinki)")
-        return nx.shortest_path(G, start_node, end_node, weight='length')
+        return shortest_path_with_index(G, start_node, end_node, weight=bike_edge_weight(G, bike_type))
 
+def find_point_to_point_path(G, orig: int, dest: int, bike_type: str = None) -> List[int]:
+    """
+    Najkrótsza ścieżka między dwoma węzłami (trasa z punktu A do punktu B).
+    Przy podanym bike_type - ścieżka o najmniejszym koszcie nawierzchni dla tego roweru,
+    w miarę możliwości tylko po dozwolonych nawierzchniach.
+    """
+    if bike_type is not None:
+        try:
+            return shortest_path_with_index(G, orig, dest, weight=bike_edge_weight(G, bike_type, passable_only=True),
+                                            search_graph=bike_graph_view(G, bike_type))
+        except nx.NetworkXNoPath:
+            pass
+    return shortest_path_with_index(G, orig, dest, weight=bike_edge_weight(G, bike_type))
+
+@profiled("route_length")
 def calculate_route_length(G, path: List[int]) -> float:
     """
     Oblicza całkowitą długość trasy.
     """
-    total_length = 0
-    for i in range(len(path) - 1):
-        u, v = path[i], path[i + 1]
-        if G.has_edge(u, v):
-            edge_data = G.get_edge_data(u, v)
-            if edge_data:
-                # Pobierz długość pierwszego dostępnego segmentu
-                length = list(edge_data.values())[0].get('length', 0)
-                total_length += length
+    # Długość pierwszego dostępnego segmentu każdej pary węzłów - jeden odczyt z tablicy
+    edges = route_edge_indices(G, path)
+    return float(get_edge_arrays(G)['length'][edges].sum())
+
+def route_edge_indices(G, path: List[int]) -> np.ndarray:
+    """
+    Zwraca numery krawędzi trasy w tablicach get_edge_arrays (pomija pary bez krawędzi).
+    """
+    edge_index = get_edge_arrays(G)['edge_index']
+    edges = [edge_index.get(pair, -1) for pair in zip(path[:-1], path[1:])]
+    edges = np.array(edges, dtype=np.int64)
+    return edges[edges >= 0]
+
+def route_surfaces(G, path: List[int]) -> set:
+    """
+    Zwraca zbiór nawierzchni na trasie ("unknown" dla krawędzi bez atrybutu surface).
+    """
+    arrays = get_edge_arrays(G)
+    surfaces = set()
+    for code in np.unique(arrays['surface'][route_edge_indices(G, path)]).tolist():
+        surfaces.update(arrays['surface_values'][code] or ("unknown",))
+    return surfaces
+
+# Indeksy pomocnicze liczone raz na graf (znikają razem z grafem)
+_graph_indexes = weakref.WeakKeyDictionary()
+
+def _graph_cache(G) -> Dict:
+    cache = _graph_indexes.get(G)
+    if cache is None:
+        cache = {}
+        _graph_indexes[G] = cache
+    return cache
+
+def get_node_coordinates(G) -> Tuple[Dict, np.ndarray]:
+    """
+    Zwraca mapę id węzła -> numer wiersza oraz tablicę współrzędnych [x, y] (lon, lat).
+    Budowane raz na graf.
+    """
+    cache = _graph_cache(G)
+    if 'node_coords' not in cache:
+        node_row = {node: row for row, node in enumerate(G.nodes)}
+        coords = np.array([(data['x'], data['y']) for _, data in G.nodes(data=True)], dtype=np.float64)
+        cache['node_coords'] = (node_row, coords)
+    return cache['node_coords']
+
+@profiled("route_coordinates")
+def route_coordinates(G, route_nodes: List[int]) -> np.ndarray:
+    """
+    Zwraca współrzędne [x, y] węzłów trasy jednym odczytem z tablicy.
+    """
+    node_row, coords = get_node_coordinates(G)
+    return coords[[node_row[node] for node in route_nodes]]
+
+def get_edge_arrays(G) -> Dict:
+    """
+    Atrybuty krawędzi w tablicach kolumnowych: węzły końcowe, długość, kod nawierzchni i kod typu drogi,
+    plus mapa (u, v) -> numer krawędzi (pierwszy wariant z równoległych krawędzi).
+    Budowane raz na graf.
+    """
+    cache = _graph_cache(G)
+    if 'edge_arrays' not in cache:
+        edge_index = {}
+        us, vs, keys, lengths, surfaces, highways = [], [], [], [], [], []
+        for i, (u, v, k, data) in enumerate(G.edges(keys=True, data=True)):
+            edge_index.setdefault((u, v), i)
+            us.append(u)
+            vs.append(v)
+            keys.append(k)
+            lengths.append(data.get('length', 0))
+            surfaces.append(data.get('surface'))
+            highways.append(data.get('highway'))
+
+        surface_vocabulary = {(): 0}
+        highway_vocabulary = {(): 0}
+        cache['edge_arrays'] = {
+            'edge_index': edge_index,
+            'u': np.array(us, dtype=np.int64),
+            'v': np.array(vs, dtype=np.int64),
+            'key': np.array(keys, dtype=np.int64),
+            'length': np.array(lengths, dtype=np.float64),
+            'surface': _encode_values(surfaces, surface_vocabulary),
+            'highway': _encode_values(highways, highway_vocabulary),
+            'surface_values': list(surface_vocabulary),
+            'highway_values': list(highway_vocabulary),
+        }
+    return cache['edge_arrays']
+
+# Dozwolone nawierzchnie dla typów rowerów (te same reguły co w skrypcie route_chorzow)
+bike_surface_rules = {
+    "miejski": ["asphalt", "paving_stones", "concrete"],
+    "trekkingowy": ["asphalt", "concrete", "gravel"],
+    "górski": ["asphalt", "concrete", "gravel", "dirt", "ground", "sand"],
+    "szosowy": ["asphalt", "concrete"]
+}
+
+# Mnożniki długości krawędzi przy wyznaczaniu tras dla danego typu roweru.
+# Wszystkie są >= 1, więc heurystyka ALT (liczona na długościach) dalej nie przeszacowuje.
+# math.inf dla "disallowed" całkowicie zakazuje niedozwolonych nawierzchni.
+SURFACE_COST_FACTORS = {
+    "allowed": 1.0,
+    "unknown": 1.5,
+    "disallowed": 10.0,
+}
+
+def surface_cost_factors(surface_values: List[Tuple], bike_type: str) -> np.ndarray:
+    """
+    Mnożnik kosztu dla każdego kodu nawierzchni z get_edge_arrays. Krawędź z kilkoma
+    nawierzchniami jest niedozwolona, jeśli którakolwiek z nich jest niedozwolona.
+    """
+    if bike_type not in bike_surface_rules:
+        raise ValueError(f"Nieznany typ roweru: {bike_type} (dostępne: {', '.join(bike_surface_rules)})")
+    allowed = set(bike_surface_rules[bike_type])
+
+    factors = []
+    for surfaces in surface_values:
+        if not surfaces:
+            factors.append(SURFACE_COST_FACTORS["unknown"])
+        elif allowed.issuperset(surfaces):
+            factors.append(SURFACE_COST_FACTORS["allowed"])
+        else:
+            factors.append(SURFACE_COST_FACTORS["disallowed"])
+    return np.array(factors, dtype=np.float64)
+
+def get_bike_edge_costs(G, bike_type: str, passable_only: bool = False) -> Dict[Tuple[int, int], float]:
+    """
+    Koszty krawędzi dla typu roweru: długość razy mnożnik nawierzchni, najmniejszy
+    z równoległych krawędzi. Krawędzie zakazane (koszt nieskończony) są pominięte.
+    passable_only bierze pod uwagę tylko krawędzie z maski get_bike_edge_mask - takich kosztów
+    trzeba używać na widoku bike_graph_view, żeby równoległa niedozwolona krawędź nie zaniżała kosztu.
+    Liczone raz na graf i typ roweru.
+    """
+    cache = _graph_cache(G).setdefault('bike_edge_costs', {})
+    if (bike_type, passable_only) not in cache:
+        arrays = get_edge_arrays(G)
+        cost = arrays['length'] * surface_cost_factors(arrays['surface_values'], bike_type)[arrays['surface']]
+        if passable_only:
+            cost = np.where(get_bike_edge_mask(G, bike_type), cost, math.inf)
+
+        costs = {}
+        for u, v, c in zip(arrays['u'].tolist(), arrays['v'].tolist(), cost.tolist()):
+            if c != math.inf and c < costs.get((u, v), math.inf):
+                costs[(u, v)] = c
+        cache[(bike_type, passable_only)] = costs
+    return cache[(bike_type, passable_only)]
+
+def bike_edge_weight(G, bike_type: str = None, passable_only: bool = False):
+    """
+    Waga dla networkx: 'length' albo funkcja kosztu nawierzchni dla podanego typu roweru
+    (passable_only - patrz get_bike_edge_costs).
+    """
+    if bike_type is None:
+        return 'length'
+    costs = get_bike_edge_costs(G, bike_type, passable_only)
+    return lambda u, v, _: costs.get((u, v))
+
+def disallowed_surfaces(surfaces, bike_type: str) -> List[str]:
+    """
+    Nawierzchnie z listy niedozwolone dla typu roweru ("unknown" nie jest liczone).
+    """
+    allowed = bike_surface_rules[bike_type]
+    return sorted(s for s in surfaces if s not in allowed and s != "unknown")
+
+def get_bike_edge_mask(G, bike_type: str) -> np.ndarray:
+    """
+    Maska krawędzi (w kolejności get_edge_arrays) przejezdnych dla typu roweru:
+    nawierzchnia dozwolona albo nieznana. Liczona raz na graf i typ roweru.
+    """
+    cache = _graph_cache(G).setdefault('bike_edge_masks', {})
+    if bike_type not in cache:
+        arrays = get_edge_arrays(G)
+        allowed = set(bike_surface_rules[bike_type])
+        passable = np.array([not surfaces or allowed.issuperset(surfaces)
+                             for surfaces in arrays['surface_values']], dtype=bool)
+        cache[bike_type] = passable[arrays['surface']]
+
+        # Zbiór wykluczonych krawędzi (u, v, k) dla filtra widoku - zwykle dużo mniejszy niż dozwolonych
+        blocked = ~cache[bike_type]
+        cache[(bike_type, 'blocked')] = set(zip(
+            arrays['u'][blocked].tolist(), arrays['v'][blocked].tolist(), arrays['key'][blocked].tolist()))
+    return cache[bike_type]
+
+def build_bike_edge_masks(G):
+    """
+    Przygotowuje maski krawędzi dla wszystkich typów rowerów (wywoływane po wczytaniu grafu).
+    """
+    for bike_type in bike_surface_rules:
+        get_bike_edge_mask(G, bike_type)
+
+def bike_graph_view(G, bike_type: str = None):
+    """
+    Widok grafu bez krawędzi o nawierzchni niedozwolonej dla typu roweru (bez kopiowania grafu).
+    Widok tworzony jest na bieżąco z zapamiętanej maski, więc nie trzyma referencji do grafu
+    w pamięci podręcznej. Bez bike_type zwraca sam graf.
+    """
+    if bike_type is None:
+        return G
+    get_bike_edge_mask(G, bike_type)
+    blocked = _graph_cache(G)['bike_edge_masks'][(bike_type, 'blocked')]
+    if not blocked:
+        return G
+    return nx.subgraph_view(G, filter_edge=lambda u, v, k: (u, v, k) not in blocked)
+
+def _unit_vectors(lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """
+    Zamienia lon/lat na wektory na sferze jednostkowej. Odległość euklidesowa między nimi
+    rośnie razem z odległością po kole wielkim, więc najbliższy sąsiad jest ten sam.
+    """
+    lon_rad = np.radians(lon)
+    lat_rad = np.radians(lat)
+    return np.column_stack((
+        np.cos(lat_rad) * np.cos(lon_rad),
+        np.cos(lat_rad) * np.sin(lon_rad),
+        np.sin(lat_rad),
+    ))
+
+def get_node_kdtree(G) -> Tuple["cKDTree", np.ndarray]:
+    """
+    Zwraca KD-drzewo węzłów grafu i tablicę id węzłów (budowane raz na graf).
+    """
+    cache = _graph_cache(G)
+    if 'node_kdtree' not in cache:
+        from scipy.spatial import cKDTree  # scipy tylko przy przyciąganiu punktów do grafu
+        node_row, coords = get_node_coordinates(G)
+        tree = cKDTree(_unit_vectors(coords[:, 0], coords[:, 1]))
+        cache['node_kdtree'] = (tree, np.fromiter(node_row, dtype=np.int64, count=len(node_row)))
+    return cache['node_kdtree']
+
+@profiled("snap")
+def snap_points_to_nodes(G, points: List[Tuple[float, float]]) -> List[int]:
+    """
+    Znajduje najbliższe węzły grafu dla wielu punktów (lon, lat) jednym zapytaniem.
+    """
+    if not points:
+        return []
+    tree, node_ids = get_node_kdtree(G)
+    points = np.asarray(points, dtype=np.float64)
+    _, rows = tree.query(_unit_vectors(points[:, 0], points[:, 1]))
+    return node_ids[rows].tolist()
+
+# Pamięć podręczna odpowiedzi Overpass/Nominatim (katalog cache/ osmnx) z limitem rozmiaru i ważnością
+OVERPASS_CACHE_MAX_BYTES = 512 * 1024 * 1024
+OVERPASS_CACHE_TTL = 30 * 24 * 3600  # sekundy
+
+class OverpassResponseCache:
+    """
+    Zastępuje zapis/odczyt pamięci podręcznej osmnx. Odpowiedzi są kompresowane
+    (zstd, jeśli dostępny jest pakiet zstandard, w przeciwnym razie gzip) i zapisywane pod
+    skrótem SHA-1 adresu zapytania - tak samo jak w osmnx, więc stare pliki .json dalej działają.
+    Czas modyfikacji pliku to czas zapisu (ważność TTL), czas dostępu - ostatnie użycie (LRU).
+    TTL, limit rozmiaru i czyszczenie dotyczą tylko plików zapisanych przez tę klasę
+    (MANAGED_SUFFIXES) - stare pliki .json (np. śledzone w repozytorium) są tylko odczytywane.
+    """
+
+    MANAGED_SUFFIXES = (".json.zst", ".json.gz")
+    SUFFIXES = MANAGED_SUFFIXES + (".json",)
+
+    def __init__(self, folder: str = None, max_bytes: int = OVERPASS_CACHE_MAX_BYTES,
+                 ttl: float = OVERPASS_CACHE_TTL):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _folder(self) -> str:
+        return self.folder or str(ox.settings.cache_folder)
+
+    def _paths(self, url: str) -> List[str]:
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return [os.path.join(self._folder(), digest + suffix) for suffix in self.SUFFIXES]
+
+    def _entries(self) -> List[os.DirEntry]:
+        if not os.path.isdir(self._folder()):
+            return []
+        return [entry for entry in os.scandir(self._folder())
+                if entry.is_file() and entry.name.endswith(self.MANAGED_SUFFIXES)]
+
+    def get(self, url: str):
+        """
+        Zwraca zapisaną odpowiedź albo None (brak wpisu lub wpis przeterminowany).
+        """
+        if not ox.settings.use_cache:
+            return None
+
+        for path in self._paths(url):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            if path.endswith(".zst") and zstandard is None:
+                # Wpis zapisany tam, gdzie był zstandard - tu nieczytelny, liczony jako brak
+                continue
+
+            now = time.time()
+            managed = path.endswith(self.MANAGED_SUFFIXES)
+            if managed and now - stat.st_mtime > self.ttl:
+                self.expired += 1
+                os.remove(path)
+                continue
+
+            with open(path, "rb") as f:
+                data = f.read()
+            if path.endswith(".zst"):
+                data = zstandard.ZstdDecompressor().decompress(data)
+            elif path.endswith(".gz"):
+                data = gzip.decompress(data)
+            if managed:
+                os.utime(path, (now, stat.st_mtime))
+            self.hits += 1
+            return json.loads(data)
+
+        self.misses += 1
+        return None
+
+    def put(self, url: str, response_json, ok: bool):
+        """
+        Zapisuje odpowiedź (jak osmnx: tylko udane i bez uwagi "remark" od serwera),
+        a potem usuwa wpisy przeterminowane i najdawniej używane ponad limit rozmiaru.
+        """
+        if not ox.settings.use_cache or not ok:
+            return
+        if isinstance(response_json, dict) and "remark" in response_json:
+            return
+
+        data = json.dumps(response_json).encode('utf-8')
+        if zstandard is not None:
+            path, data = self._paths(url)[0], zstandard.ZstdCompressor(level=10).compress(data)
+        else:
+            path, data = self._paths(url)[1], gzip.compress(data, compresslevel=6)
+
+        os.makedirs(self._folder(), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.prune()
+
+    def prune(self) -> int:
+        """
+        Usuwa wpisy przeterminowane oraz najdawniej używane, dopóki rozmiar przekracza limit.
+        Zwraca liczbę usuniętych plików.
+        """
+        now = time.time()
+        entries = [(entry.stat(), entry.path) for entry in self._entries()]
+        removed = 0
+
+        fresh = []
+        for stat, path in entries:
+            if now - stat.st_mtime > self.ttl:
+                os.remove(path)
+                self.expired += 1
+                removed += 1
+            else:
+                fresh.append((stat, path))
+
+        total = sum(stat.st_size for stat, _ in fresh)
+        for stat, path in sorted(fresh, key=lambda item: item[0].st_atime):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= stat.st_size
+            self.evictions += 1
+            removed += 1
+        return removed
+
+    def clear(self) -> int:
+        """
+        Usuwa wszystkie wpisy zapisane przez tę klasę. Zwraca liczbę usuniętych plików.
+        """
+        entries = self._entries()
+        for entry in entries:
+            os.remove(entry.path)
+        return len(entries)
+
+    def stats(self) -> Dict:
+        """
+        Liczniki tego procesu oraz stan zarządzanych plików na dysku.
+        """
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(entry.stat().st_size for entry in entries),
+            'max_bytes': self.max_bytes,
+            'compression': "zstd" if zstandard is not None else "gzip",
+        }
+
+    def install(self, module):
+        """
+        Podpina pamięć podręczną pod osmnx (zapytania Overpass i Nominatim).
+        Wywoływane przy pierwszym użyciu osmnx (patrz _configure_osmnx).
+        """
+        module._http._retrieve_from_cache = self.get
+        module._http._save_to_cache = self.put
+
+overpass_cache = OverpassResponseCache()
+
+def print_overpass_cache_stats():
+    stats = overpass_cache.stats()
+    print(f"Cache Overpass: trafienia {stats['hits']}, chybienia {stats['misses']}, "
+          f"przeterminowane {stats['expired']}, usunięte {stats['evictions']}, "
+          f"{stats['entries']} plików, {stats['bytes']/1024/1024:.1f} MB / {stats['max_bytes']/1024/1024:.0f} MB "
+          f"({stats['compression']})")
+
+# Lokalny magazyn grafów - zamiast wywoływać ox.graph_from_point przy każdym uruchomieniu
+GRAPH_STORE_DIR = "graph_store"
+GRAPH_STORE_VERSION = 2
+
+# Grafy wczytane w tym procesie (LRU) - długo działający serwer nie trzyma każdego odwiedzonego obszaru
+LOADED_GRAPHS_CACHE_SIZE = 4
+_loaded_graphs = OrderedDict()  # klucz regionu -> graf już wczytany w tym procesie
+
+def _remember_graph(key: str, G):
+    _loaded_graphs[key] = G
+    _loaded_graphs.move_to_end(key)
+    while len(_loaded_graphs) > LOADED_GRAPHS_CACHE_SIZE:
+        _loaded_graphs.popitem(last=False)
+
+def graph_region_key(center_lat: float, center_lon: float, dist: float, network_type: str = "bike") -> str:
+    """
+    Wyznacza klucz regionu dla magazynu grafów.
+    Środek jest zaokrąglany do siatki 0.01°, a promień w górę do pełnych kilometrów
+    z zapasem 1 km, dzięki czemu pobliskie zapytania trafiają w ten sam graf.
+    """
+    lat_bucket = round(center_lat, 2)
+    lon_bucket = round(center_lon, 2)
+    dist_km = int(math.ceil(dist / 1000)) + 1
+    return f"{network_type}_{lat_bucket:.2f}_{lon_bucket:.2f}_{dist_km}km"
+
+def _encode_values(values, vocabulary: Dict) -> np.ndarray:
+    """
+    Zamienia wartości atrybutu (napis, lista napisów lub brak) na kody liczbowe.
+    Kod 0 oznacza brak atrybutu.
+    """
+    codes = np.zeros(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        parts = tuple(value) if isinstance(value, list) else (value,)
+        codes[i] = vocabulary.setdefault(parts, len(vocabulary))
+    return codes
+
+def save_graph_to_store(G, key: str, center: Tuple[float, float] = None, dist: float = None,
+                        network_type: str = "bike", store_dir: str = GRAPH_STORE_DIR,
+                        extra_tables: Dict = None, extra_meta: Dict = None) -> str:
+    """
+    Zapisuje graf jako tablice węzłów i krawędzi (pliki .npy) oraz metadane (meta.json).
+    extra_tables/extra_meta pozwalają dołączyć do wpisu dodatkowe indeksy.
+    """
+    node_ids = np.fromiter(G.nodes, dtype=np.int64, count=len(G))
+    node_row = {node: row for row, node in enumerate(node_ids.tolist())}
+    node_x = np.array([data['x'] for _, data in G.nodes(data=True)], dtype=np.float64)
+    node_y = np.array([data['y'] for _, data in G.nodes(data=True)], dtype=np.float64)
+
+    edges = list(G.edges(keys=True, data=True))
+    surface_vocabulary = {(): 0}
+    highway_vocabulary = {(): 0}
+
+    tables = {
+        'node_id': node_ids,
+        'node_x': node_x,
+        'node_y': node_y,
+        'edge_u': np.array([node_row[u] for u, _, _, _ in edges], dtype=np.int32),
+        'edge_v': np.array([node_row[v] for _, v, _, _ in edges], dtype=np.int32),
+        'edge_key': np.array([k for _, _, k, _ in edges], dtype=np.int32),
+        'edge_length': np.array([d.get('length', 0) for _, _, _, d in edges], dtype=np.float64),
+        'edge_surface': _encode_values([d.get('surface') for _, _, _, d in edges], surface_vocabulary),
+        'edge_highway': _encode_values([d.get('highway') for _, _, _, d in edges], highway_vocabulary),
+    }
+
+    meta = {
+        'version': GRAPH_STORE_VERSION,
+        'key': key,
+        'network_type': network_type,
+        'center': list(center) if center else None,
+        'dist': dist,
+        'graph_attrs': {k: str(v) for k, v in G.graph.items()},
+        'surface_values': [list(v) for v in surface_vocabulary],
+        'highway_values': [list(v) for v in highway_vocabulary],
+        'node_count': len(node_ids),
+        'edge_count': len(edges),
+    }
+    tables.update(extra_tables or {})
+    meta.update(extra_meta or {})
+
+    # Zapis do katalogu tymczasowego i podmiana - przerwany zapis nie psuje magazynu
+    target_dir = os.path.join(store_dir, key)
+    tmp_dir = target_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, array in tables.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    shutil.rmtree(target_dir, ignore_errors=True)
+    os.replace(tmp_dir, target_dir)
+    return target_dir
+
+def open_graph_store(key: str, store_dir: str = GRAPH_STORE_DIR) -> Dict:
+    """
+    Otwiera wpis magazynu bez wczytywania danych - tablice są mapowane z pliku
+    (np.load z mmap_mode) i czytane dopiero przy pierwszym użyciu.
+    Zwraca None, gdy wpisu nie ma lub ma nieaktualną wersję formatu.
+    """
+    entry_dir = os.path.join(store_dir, key)
+    meta_path = os.path.join(entry_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path, "r", encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('version') != GRAPH_STORE_VERSION:
+        return None
+
+    tables = {'meta': meta}
+    for file_name in os.listdir(entry_dir):
+        if file_name.endswith(".npy"):
+            tables[file_name[:-4]] = np.load(os.path.join(entry_dir, file_name), mmap_mode='r')
+    return tables
+
+def _decode_value(parts: List[str]):
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else list(parts)
+
+def graph_from_store_tables(tables: Dict):
+    """
+    Buduje graf networkx (MultiDiGraph w formacie osmnx) z tablic magazynu.
+    To nie jest leniwe: wszystkie węzły i krawędzie trafiają do grafu od razu, co dla ~40 tys.
+    węzłów trwa ułamek sekundy, a dla grafu regionu - sekundy (etap "load" w bench).
+    Bez zmian zostają tylko gotowe tablice (współrzędne, atrybuty krawędzi) - bez przeliczania.
+    """
+    meta = tables['meta']
+    surface_values = [_decode_value(v) for v in meta['surface_values']]
+    highway_values = [_decode_value(v) for v in meta['highway_values']]
+
+    node_ids = tables['node_id'].tolist()
+    G = nx.MultiDiGraph(**meta['graph_attrs'])
+    G.add_nodes_from(
+        (node, {'x': x, 'y': y})
+        for node, x, y in zip(node_ids, tables['node_x'].tolist(), tables['node_y'].tolist())
+    )
+
+    edges = []
+    for u, v, k, length, surface, highway in zip(
+            tables['edge_u'].tolist(), tables['edge_v'].tolist(), tables['edge_key'].tolist(),
+            tables['edge_length'].tolist(), tables['edge_surface'].tolist(), tables['edge_highway'].tolist()):
+        attrs = {'length': length}
+        if surface:
+            attrs['surface'] = surface_values[surface]
+        if highway:
+            attrs['highway'] = highway_values[highway]
+        edges.append((node_ids[u], node_ids[v], k, attrs))
+    G.add_edges_from(edges)
+
+    G.graph['graph_store_key'] = meta['key']
+
+    # Tablice współrzędnych i atrybutów krawędzi są już gotowe w magazynie
+    node_row = {node: row for row, node in enumerate(node_ids)}
+    coords = np.column_stack((tables['node_x'], tables['node_y']))
+    _graph_cache(G)['node_coords'] = (node_row, coords)
+
+    edge_index = {}
+    for i, (u, v, _, _) in enumerate(edges):
+        edge_index.setdefault((u, v), i)
+    _graph_cache(G)['edge_arrays'] = {
+        'edge_index': edge_index,
+        'u': np.asarray(tables['node_id'])[tables['edge_u']],
+        'v': np.asarray(tables['node_id'])[tables['edge_v']],
+        'key': np.asarray(tables['edge_key']),
+        'length': np.asarray(tables['edge_length']),
+        'surface': np.asarray(tables['edge_surface']),
+        'highway': np.asarray(tables['edge_highway']),
+        'surface_values': [tuple(v) for v in meta['surface_values']],
+        'highway_values': [tuple(v) for v in meta['highway_values']],
+    }
+    return G
+
+def load_graph_from_store(key: str, store_dir: str = GRAPH_STORE_DIR):
+    """
+    Wczytuje graf z magazynu (lub z pamięci procesu, jeśli był już wczytany).
+    Szybsze niż pobieranie i upraszczanie grafu z OSM, ale koszt rośnie z rozmiarem grafu
+    (patrz graph_from_store_tables) - dlatego grafy zostają w pamięci procesu.
+    """
+    if key in _loaded_graphs:
+        _loaded_graphs.move_to_end(key)
+        return _loaded_graphs[key]
+
+    tables = open_graph_store(key, store_dir)
+    if tables is None:
+        return None
+
+    G = graph_from_store_tables(tables)
+    _remember_graph(key, G)
+    return G
+
+def load_or_build_graph(center_lat: float, center_lon: float, dist: float,
+                        network_type: str = "bike", refresh: bool = False,
+                        store_dir: str = GRAPH_STORE_DIR):
+    """
+    Zwraca graf obejmujący okrąg o promieniu dist wokół punktu.
+    Graf jest brany z magazynu, a pobierany z OSM tylko przy braku wpisu lub przy refresh=True.
+    """
+    key = graph_region_key(center_lat, center_lon, dist, network_type)
+
+    if not refresh:
+        G = load_graph_from_store(key, store_dir)
+        if G is not None:
+            print(f"Graf wczytany z magazynu: {key}")
+            return G
+
+    # Pobieramy graf dla zaokrąglonego środka i promienia, tak aby pasował do klucza
+    lat_bucket, lon_bucket = round(center_lat, 2), round(center_lon, 2)
+    dist_bucket = (int(math.ceil(dist / 1000)) + 1) * 1000
+    G = ox.graph_from_point((lat_bucket, lon_bucket), dist=dist_bucket, network_type=network_type)
+
+    save_graph_to_store(G, key, center=(lat_bucket, lon_bucket), dist=dist_bucket,
+                        network_type=network_type, store_dir=store_dir)
+    G.graph['graph_store_key'] = key
+    _remember_graph(key, G)
+    print(f"Graf zapisany w magazynie: {key}")
+    return G
+
+def list_graph_store(store_dir: str = GRAPH_STORE_DIR) -> List[Dict]:
+    """
+    Zwraca metadane wszystkich wpisów magazynu.
+    """
+    if not os.path.isdir(store_dir):
+        return []
+
+    entries = []
+    for key in sorted(os.listdir(store_dir)):
+        meta_path = os.path.join(store_dir, key, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding='utf-8') as f:
+                entries.append(json.load(f))
+    return entries
+
+def invalidate_graph_store(key: str = None, store_dir: str = GRAPH_STORE_DIR) -> int:
+    """
+    Usuwa wpis magazynu (albo wszystkie, gdy key=None). Zwraca liczbę usuniętych wpisów.
+    """
+    keys = [key] if key else [entry['key'] for entry in list_graph_store(store_dir)]
+
+    removed = 0
+    for entry_key in keys:
+        entry_dir = os.path.join(store_dir, entry_key)
+        _loaded_graphs.pop(entry_key, None)
+        if os.path.isdir(entry_dir):
+            shutil.rmtree(entry_dir)
+            removed += 1
+    return removed
+
+def refresh_graph_store(key: str = None, store_dir: str = GRAPH_STORE_DIR) -> int:
+    """
+    Pobiera ponownie graf dla wpisu (albo wszystkich wpisów) i nadpisuje go w magazynie.
+    Regiony budowane są od nowa z zapytania o miejsce lub z wyciągu OSM, z którego powstały;
+    regiony bez zapisanego źródła są pomijane. Zwraca liczbę odświeżonych wpisów.
+    """
+    entries = [e for e in list_graph_store(store_dir) if key is None or e['key'] == key]
+
+    refreshed = 0
+    for entry in entries:
+        if 'tile_grid' in entry:
+            refreshed += refresh_regional_graph(entry, store_dir)
+            continue
+
+        lat, lon = entry['center']
+        _loaded_graphs.pop(entry['key'], None)
+        G = ox.graph_from_point((lat, lon), dist=entry['dist'], network_type=entry['network_type'])
+        save_graph_to_store(G, entry['key'], center=(lat, lon), dist=entry['dist'],
+                            network_type=entry['network_type'], store_dir=store_dir)
+        print(f"Odświeżono: {entry['key']}")
+        refreshed += 1
+    return refreshed
+
+# Indeks kafelkowy dla dużego grafu regionalnego (np. całe województwo śląskie)
+REGIONAL_TILE_SIZE = 0.05  # bok kafelka w stopniach
+
+def regional_store_key(region_name: str) -> str:
+    return f"region_{region_name}"
+
+def build_tile_index(node_x: np.ndarray, node_y: np.ndarray, tile_size: float = REGIONAL_TILE_SIZE) -> Tuple[Dict, Dict]:
+    """
+    Dzieli węzły na kafelki siatki. Zwraca tablice indeksu (węzły posortowane
+    po kafelku + przesunięcia) oraz parametry siatki do zapisania w metadanych.
+    """
+    min_lon, min_lat = float(node_x.min()), float(node_y.min())
+    columns = int((float(node_x.max()) - min_lon) // tile_size) + 1
+
+    tile_x = ((node_x - min_lon) // tile_size).astype(np.int64)
+    tile_y = ((node_y - min_lat) // tile_size).astype(np.int64)
+    tile_of_node = tile_y * columns + tile_x
+
+    order = np.argsort(tile_of_node, kind='stable')
+    tile_ids, offsets = np.unique(tile_of_node[order], return_index=True)
+
+    tables = {
+        'tile_node_rows': order.astype(np.int32),
+        'tile_ids': tile_ids,
+        'tile_offsets': np.append(offsets, len(order)).astype(np.int64),
+    }
+    grid = {
+        'tile_size': tile_size,
+        'min_lon': min_lon,
+        'min_lat': min_lat,
+        'max_lon': float(node_x.max()),
+        'max_lat': float(node_y.max()),
+        'columns': columns,
+    }
+    return tables, grid
+
+def build_regional_graph(region_name: str, place_query: str, network_type: str = "bike",
+                         store_dir: str = GRAPH_STORE_DIR):
+    """
+    Pobiera jednorazowo graf całego regionu i zapisuje go w magazynie razem z indeksem kafelków.
+    """
+    print(f"Pobieranie grafu regionu: {place_query}...")
+    G = ox.graph_from_place(place_query, network_type=network_type)
+    return save_regional_graph(G, region_name, network_type, store_dir, source={'place': place_query})
 
-    return total_length
+def save_regional_graph(G, region_name: str, network_type: str = "bike", store_dir: str = GRAPH_STORE_DIR,
+                        source: Dict = None):
+    """
+    Zapisuje graf regionu w magazynie razem z indeksem kafelków.
+    source ({'place': zapytanie} albo {'extract': ścieżka}) pozwala później odświeżyć region.
+    """
+    key = regional_store_key(region_name)
+
+    # Kolejność węzłów taka sama jak w tablicach zapisywanych przez save_graph_to_store
+    node_x = np.array([data['x'] for _, data in G.nodes(data=True)], dtype=np.float64)
+    node_y = np.array([data['y'] for _, data in G.nodes(data=True)], dtype=np.float64)
+    tile_tables, grid = build_tile_index(node_x, node_y)
+    save_graph_to_store(G, key, network_type=network_type, store_dir=store_dir,
+                        extra_tables=tile_tables,
+                        extra_meta={'tile_grid': grid, 'region': region_name, 'source': source})
+    _loaded_graphs.pop(key, None)
+    print(f"Region {region_name}: {len(G)} węzłów, {len(tile_tables['tile_ids'])} kafelków")
+    return G
+
+def refresh_regional_graph(entry: Dict, store_dir: str = GRAPH_STORE_DIR) -> int:
+    """
+    Buduje region od nowa z jego źródła. Zwraca 1 po odświeżeniu, 0 gdy źródło jest nieznane.
+    """
+    region_name = entry.get('region') or entry['key'][len(regional_store_key("")):]
+    source = entry.get('source') or {}
+    if 'place' in source:
+        build_regional_graph(region_name, source['place'], entry['network_type'], store_dir)
+    elif 'extract' in source and os.path.exists(source['extract']):
+        ingest_osm_extract(source['extract'], region_name, entry['network_type'], store_dir)
+    else:
+        print(f"Pominięto {entry['key']}: brak źródła regionu (zbuduj go ponownie poleceniem region lub ingest)")
+        return 0
+    print(f"Odświeżono: {entry['key']}")
+    return 1
+
+def load_regional_graph(region_name: str, store_dir: str = GRAPH_STORE_DIR) -> Tuple:
+    """
+    Zwraca (graf, tablice magazynu) regionu. Graf zostaje w pamięci procesu (patrz _loaded_graphs).
+    """
+    key = regional_store_key(region_name)
+    tables = open_graph_store(key, store_dir)
+    if tables is None or 'tile_grid' not in tables['meta']:
+        return None, None
+    return load_graph_from_store(key, store_dir), tables
+
+def bbox_around_point(lat: float, lon: float, radius: float) -> Tuple[float, float, float, float]:
+    """
+    Prostokąt (min_lon, min_lat, max_lon, max_lat) zawierający okrąg o promieniu radius metrów.
+    """
+    dlat = math.degrees(radius / 6371000)
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return lon - dlon, lat - dlat, lon + dlon, lat + dlat
+
+# Ostatnio wycięte podgrafy regionów - ten sam podgraf to te same (już zbudowane) indeksy
+REGIONAL_SUBGRAPH_CACHE_SIZE = 8
+_region_subgraphs = OrderedDict()  # (klucz regionu, zakres kafelków) -> (graf regionu, podgraf)
+
+def subgraph_for_bbox(region_name: str, bbox: Tuple[float, float, float, float],
+                      store_dir: str = GRAPH_STORE_DIR):
+    """
+    Wycina z grafu regionalnego podgraf dla prostokąta, korzystając z indeksu kafelków.
+    Podgraf obejmuje całe kafelki przecinające prostokąt, więc zapytania z okolicy dostają
+    ten sam zapamiętany podgraf (razem z KD-drzewem, tablicami krawędzi i drzewami ścieżek).
+    Zwraca None, jeśli region nie istnieje lub nie pokrywa całego prostokąta.
+    """
+    G, tables = load_regional_graph(region_name, store_dir)
+    if G is None:
+        return None
+
+    grid = tables['meta']['tile_grid']
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if (min_lon < grid['min_lon'] or min_lat < grid['min_lat'] or
+            max_lon > grid['max_lon'] or max_lat > grid['max_lat']):
+        return None
+
+    size = grid['tile_size']
+    tx0 = int((min_lon - grid['min_lon']) // size)
+    tx1 = int((max_lon - grid['min_lon']) // size)
+    ty0 = int((min_lat - grid['min_lat']) // size)
+    ty1 = int((max_lat - grid['min_lat']) // size)
+
+    cache_key = (regional_store_key(region_name), store_dir, tx0, tx1, ty0, ty1)
+    cached = _region_subgraphs.get(cache_key)
+    if cached is not None and cached[0] is G:
+        _region_subgraphs.move_to_end(cache_key)
+        return cached[1]
+
+    wanted = np.array([ty * grid['columns'] + tx
+                       for ty in range(ty0, ty1 + 1) for tx in range(tx0, tx1 + 1)], dtype=np.int64)
+    tile_ids = tables['tile_ids']
+    positions = np.searchsorted(tile_ids, wanted)
+    found = positions < len(tile_ids)
+    found[found] = tile_ids[positions[found]] == wanted[found]
+    positions = positions[found]
+
+    offsets = tables['tile_offsets']
+    rows = np.concatenate([tables['tile_node_rows'][offsets[p]:offsets[p + 1]] for p in positions]) \
+        if len(positions) else np.empty(0, dtype=np.int32)
+    nodes = tables['node_id'][rows].tolist()
+
+    sub_G = G.subgraph(nodes).copy()
+    sub_G.graph.pop('graph_store_key', None)
+    sub_G.graph['region'] = region_name
+
+    _region_subgraphs[cache_key] = (G, sub_G)
+    while len(_region_subgraphs) > REGIONAL_SUBGRAPH_CACHE_SIZE:
+        _region_subgraphs.popitem(last=False)
+    return sub_G
+
+def subgraph_around_point(region_name: str, lat: float, lon: float, radius: float,
+                          store_dir: str = GRAPH_STORE_DIR):
+    """
+    Podgraf regionu wokół punktu startowego - prostokąt jest docinany do granic regionu,
+    więc punkt przy krawędzi regionu nie wymaga pobierania grafu z sieci.
+    Zwraca None, gdy region nie istnieje albo punkt leży poza nim.
+    """
+    G, tables = load_regional_graph(region_name, store_dir)
+    if G is None:
+        return None
+
+    grid = tables['meta']['tile_grid']
+    if not (grid['min_lon'] <= lon <= grid['max_lon'] and grid['min_lat'] <= lat <= grid['max_lat']):
+        return None
+    min_lon, min_lat, max_lon, max_lat = bbox_around_point(lat, lon, radius)
+    bbox = (max(min_lon, grid['min_lon']), max(min_lat, grid['min_lat']),
+            min(max_lon, grid['max_lon']), min(max_lat, grid['max_lat']))
+    return subgraph_for_bbox(region_name, bbox, store_dir)
+
+# Wczytywanie lokalnych wyciągów OSM (.osm, .osm.bz2, .osm.gz, .pbf) zamiast zapytań do Overpass
+CYCLEWAY_TAGS = ["highway", "surface", "width", "lit", "smoothness", "name"]
+
+def overpass_tag_filter(network_filter: str):
+    """
+    Zamienia filtr Overpass używany przez osmnx (np. ["highway"]["area"!~"yes"]...)
+    na funkcję sprawdzającą słownik tagów drogi.
+    """
+    conditions = [(key, operator, re.compile(pattern))
+                  for key, operator, pattern in re.findall(r'\["([^"]+)"(?:(!?~)"([^"]*)")?\]', network_filter)]
+
+    def matches(tags: Dict) -> bool:
+        for key, operator, pattern in conditions:
+            value = tags.get(key)
+            if operator == "":
+                if value is None:
+                    return False
+            elif operator == "~":
+                if value is None or not pattern.search(value):
+                    return False
+            elif value is not None and pattern.search(value):
+                return False
+        return True
+
+    return matches
+
+def _iter_osm_xml(path: str, element_type: str) -> Iterator[Tuple]:
+    opener = bz2.open if path.endswith(".bz2") else gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, element in context:
+            if event != "end" or element.tag not in ("node", "way", "relation"):
+                continue
+            if element.tag == element_type == "node":
+                yield int(element.get("id")), float(element.get("lon")), float(element.get("lat"))
+            elif element.tag == element_type == "way":
+                refs = [int(nd.get("ref")) for nd in element.iter("nd")]
+                tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+                yield int(element.get("id")), refs, tags
+            # Przetworzone elementy usuwamy z drzewa, żeby pamięć nie rosła z rozmiarem pliku
+            root.clear()
+
+def _iter_osm_pbf(path: str, element_type: str) -> Iterator[Tuple]:
+    try:
+        import osmium
+    except ImportError:
+        raise RuntimeError("Do wczytywania plików .pbf potrzebny jest pakiet osmium (pip install osmium)")
+
+    entities = osmium.osm.NODE if element_type == "node" else osmium.osm.WAY
+    for obj in osmium.FileProcessor(path, entities):
+        if element_type == "node" and obj.is_node() and obj.location.valid():
+            yield obj.id, obj.location.lon, obj.location.lat
+        elif element_type == "way" and obj.is_way():
+            yield obj.id, [n.ref for n in obj.nodes], {tag.k: tag.v for tag in obj.tags}
+
+def iter_osm_extract(path: str, element_type: str) -> Iterator[Tuple]:
+    """
+    Strumieniowo czyta wyciąg OSM. Dla element_type="node" zwraca (id, lon, lat),
+    dla "way" - (id, lista węzłów, tagi).
+    """
+    if path.endswith(".pbf"):
+        return _iter_osm_pbf(path, element_type)
+    return _iter_osm_xml(path, element_type)
+
+def graph_from_overpass_responses(responses: List[Dict], network_type: str = "bike"):
+    """
+    Graf z odpowiedzi Overpass (lub z danych w tym samym formacie) - tak jak buduje go osmnx
+    przy pobieraniu z sieci: największa słabo spójna składowa, uproszczona topologia.
+    """
+    G = ox.graph._create_graph(responses, bidirectional=network_type in ox.settings.bidirectional_network_types)
+    G = ox.truncate.largest_component(G, strongly=False)
+    return ox.simplify_graph(G)
+
+def ingest_osm_extract(path: str, region_name: str, network_type: str = "bike",
+                       store_dir: str = GRAPH_STORE_DIR):
+    """
+    Buduje graf sieci i listę dróg rowerowych z lokalnego wyciągu OSM i zapisuje je
+    w magazynie jako region (działa potem --region bez dostępu do sieci).
+    Plik czytany jest dwa razy: najpierw drogi, potem tylko współrzędne potrzebnych węzłów,
+    więc w pamięci nie są trzymane wszystkie węzły wyciągu.
+    """
+    network_filter = overpass_tag_filter(ox._overpass._get_network_filter(network_type))
+    way_tags = set(ox.settings.useful_tags_way)
+
+    print(f"Wczytywanie dróg z wyciągu {path}...")
+    ways, cycleways, needed_nodes = [], [], set()
+    for way_id, refs, tags in iter_osm_extract(path, "way"):
+        in_network = network_filter(tags)
+        is_cycleway = tags.get("highway") == "cycleway"
+        if in_network:
+            ways.append({"type": "way", "id": way_id, "nodes": refs,
+                         "tags": {k: v for k, v in tags.items() if k in way_tags}})
+        if is_cycleway:
+            cycleways.append({"type": "way", "id": way_id, "nodes": refs,
+                              "tags": {k: v for k, v in tags.items() if k in CYCLEWAY_TAGS}})
+        if in_network or is_cycleway:
+            needed_nodes.update(refs)
+
+    print(f"Wczytywanie współrzędnych {len(needed_nodes)} węzłów...")
+    node_coords = {}
+    for node_id, lon, lat in iter_osm_extract(path, "node"):
+        if node_id in needed_nodes:
+            node_coords[node_id] = (lon, lat)
+
+    # Ten sam format co odpowiedź Overpass, więc graf budowany jest tak samo jak przy pobieraniu z sieci
+    elements = [{"type": "node", "id": node_id, "lon": lon, "lat": lat}
+                for node_id, (lon, lat) in node_coords.items()]
+    elements += [way for way in ways if all(ref in node_coords for ref in way["nodes"])]
+    G = graph_from_overpass_responses([{"elements": elements}], network_type)
+    save_regional_graph(G, region_name, network_type, store_dir, source={'extract': os.path.abspath(path)})
+
+    # Drogi rowerowe zapisujemy jak odpowiedź Overpass z "out geom" - lokalny zamiennik zapytania
+    cycleway_elements = [
+        {"type": "way", "id": way["id"], "tags": way["tags"],
+         "geometry": [{"lat": node_coords[ref][1], "lon": node_coords[ref][0]} for ref in way["nodes"]]}
+        for way in cycleways if all(ref in node_coords for ref in way["nodes"])
+    ]
+    with open(os.path.join(store_dir, regional_store_key(region_name), "cycleways.json"), "w", encoding='utf-8') as f:
+        json.dump({"elements": cycleway_elements}, f, ensure_ascii=False)
+    print(f"Zapisano {len(cycleway_elements)} dróg rowerowych")
+    return G
+
+def load_cycleways(region_name: str, store_dir: str = GRAPH_STORE_DIR):
+    """
+    GeoDataFrame dróg rowerowych regionu zapisanych przez ingest_osm_extract
+    (te same kolumny co w skrypcie z zapytaniem do Overpass). Zwraca None, gdy brak danych.
+    """
+    path = os.path.join(store_dir, regional_store_key(region_name), "cycleways.json")
+    if not os.path.exists(path):
+        return None
+
+    import geopandas as gpd
+    from shapely.geometry import LineString
+
+    with open(path, "r", encoding='utf-8') as f:
+        elements = json.load(f)["elements"]
+    rows = [
+        dict({tag: e["tags"].get(tag) for tag in CYCLEWAY_TAGS},
+             geometry=LineString([(pt["lon"], pt["lat"]) for pt in e["geometry"]]))
+        for e in elements
+    ]
+    return gpd.GeoDataFrame(rows, geometry="geometry", crs="EPSG:4326")
+
+@profiled("load_graph")
+def load_graph_for_area(center_lat: float, center_lon: float, radius: float,
+                        region: str = None, network_type: str = "bike"):
+    """
+    Zwraca graf dla obszaru zapytania: najpierw z grafu regionalnego (jeśli podano region
+    i go pokrywa), w przeciwnym razie z magazynu grafów lub z OSM.
+    """
+    G = None
+    if region:
+        G = subgraph_for_bbox(region, bbox_around_point(center_lat, center_lon, radius))
+        if G is not None:
+            print(f"Podgraf wycięty z regionu {region}")
+        else:
+            print(f"Region {region} nie pokrywa obszaru zapytania - używam magazynu grafów")
+    if G is None:
+        G = load_or_build_graph(center_lat, center_lon, radius, network_type=network_type)
+
+    # Maski krawędzi dla typów rowerów liczone od razu - widoki tworzone są z nich bez kopiowania
+    build_bike_edge_masks(G)
+    return G
+
+# Indeks ALT (A* z punktami orientacyjnymi) - opcjonalne przyspieszenie wyszukiwania
+ALT_LANDMARKS = 8
+
+def build_alt_index(G, num_landmarks: int = ALT_LANDMARKS) -> Dict:
+    """
+    Wybiera punkty orientacyjne (kolejno najdalsze od już wybranych) i liczy odległości
+    od nich i do nich dla wszystkich węzłów. Tablice są w kolejności wierszy get_node_coordinates.
+    """
+    node_row, coords = get_node_coordinates(G)
+    num_landmarks = min(num_landmarks, len(node_row))
+    reversed_G = G.reverse(copy=False)
+
+    def distances(graph, source) -> np.ndarray:
+        result = np.full(len(node_row), np.inf)
+        for node, dist in nx.single_source_dijkstra_path_length(graph, source, weight='length').items():
+            result[node_row[node]] = dist
+        return result
+
+    # Pierwszy punkt: węzeł najdalszy od środka obszaru
+    center = coords.mean(axis=0)
+    node_ids = list(node_row)
+    landmark = node_ids[int(np.argmax(((coords - center) ** 2).sum(axis=1)))]
+
+    landmarks, dist_from, dist_to = [], [], []
+    for _ in range(num_landmarks):
+        landmarks.append(landmark)
+        dist_from.append(distances(G, landmark))
+        dist_to.append(distances(reversed_G, landmark))
+
+        # Następny punkt: osiągalny węzeł najdalszy od wszystkich dotychczasowych
+        closest = np.min(dist_from, axis=0)
+        closest[~np.isfinite(closest)] = -1
+        landmark = node_ids[int(np.argmax(closest))]
+        if landmark in landmarks:
+            break
+
+    return {
+        'alt_landmarks': np.array(landmarks, dtype=np.int64),
+        'alt_dist_from': np.array(dist_from),
+        'alt_dist_to': np.array(dist_to),
+    }
+
+def get_alt_index(G, build: bool = False, store_dir: str = GRAPH_STORE_DIR) -> Dict:
+    """
+    Zwraca indeks ALT grafu: z pamięci, z magazynu grafów albo (przy build=True) buduje go
+    i zapisuje obok grafu w magazynie. Bez build=True i bez zapisanego indeksu zwraca None.
+    Podgraf wycięty z regionu (subgraph_for_bbox) dostaje wiersze indeksu całego regionu -
+    indeks budowany jest raz na region, a nie dla każdego podgrafu.
+    """
+    cache = _graph_cache(G)
+    if cache.get('alt_index') is not None:
+        return cache['alt_index']
+
+    key = G.graph.get('graph_store_key')
+    entry_dir = os.path.join(store_dir, key) if key else None
+    region_index = None
+    if not key and G.graph.get('region'):
+        region_G, _ = load_regional_graph(G.graph['region'], store_dir)
+        if region_G is not None:
+            region_index = get_alt_index(region_G, build, store_dir)
+
+    if region_index is not None:
+        # Odległości w regionie nie są większe niż w jego podgrafie (podgraf ma tylko część krawędzi),
+        # więc ograniczenia z indeksu regionu są dla podgrafu nadal poprawne
+        region_row, _ = get_node_coordinates(region_G)
+        rows = np.array([region_row[node] for node in get_node_coordinates(G)[0]], dtype=np.int64)
+        index = {
+            'alt_landmarks': np.asarray(region_index['alt_landmarks']),
+            'alt_dist_from': np.asarray(region_index['alt_dist_from'])[:, rows],
+            'alt_dist_to': np.asarray(region_index['alt_dist_to'])[:, rows],
+        }
+    elif entry_dir and os.path.exists(os.path.join(entry_dir, "alt_landmarks.npy")):
+        index = {name: np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode='r')
+                 for name in ('alt_landmarks', 'alt_dist_from', 'alt_dist_to')}
+    elif build:
+        index = build_alt_index(G)
+        if entry_dir and os.path.isdir(entry_dir):
+            for name, array in index.items():
+                np.save(os.path.join(entry_dir, f"{name}.npy"), array)
+    else:
+        return None
+
+    cache['alt_index'] = index
+    cache.pop('alt_rows', None)
+    return index
+
+def alt_heuristic(G, index: Dict, target: int):
+    """
+    Dolne ograniczenie odległości do celu z nierówności trójkąta względem punktów orientacyjnych.
+    Liczone dopiero dla węzłów, które odwiedza A* - koszt przygotowania nie zależy od rozmiaru grafu.
+    """
+    node_row, _ = get_node_coordinates(G)
+    cache = _graph_cache(G)
+    if cache.get('alt_rows') is None:
+        # Odległości węzła do/od wszystkich punktów orientacyjnych w jednym wierszu (raz na graf)
+        cache['alt_rows'] = (np.ascontiguousarray(index['alt_dist_from'].T).tolist(),
+                             np.ascontiguousarray(index['alt_dist_to'].T).tolist())
+    from_rows, to_rows = cache['alt_rows']
+    target_from = from_rows[node_row[target]]
+    target_to = to_rows[node_row[target]]
+
+    def heuristic(node, _target):
+        row = node_row[node]
+        bound = 0.0
+        for landmark_to_target, landmark_to_node, node_to_landmark, target_to_landmark in zip(
+                target_from, from_rows[row], to_rows[row], target_to):
+            # inf - inf daje nan, a porównanie z nan jest fałszywe - taki punkt jest pomijany
+            forward = landmark_to_target - landmark_to_node
+            if forward > bound:
+                bound = forward
+            backward = node_to_landmark - target_to_landmark
+            if backward > bound:
+                bound = backward
+        return bound
+
+    return heuristic
+
+def shortest_path_with_index(G, start_node: int, end_node: int, weight='length', search_graph=None) -> List[int]:
+    """
+    Najkrótsza ścieżka: A* z indeksem ALT, jeśli graf go ma, w przeciwnym razie Dijkstra.
+    Wagi nie mniejsze od długości (np. maskowanie krawędzi) nie psują heurystyki.
+    search_graph (np. widok bike_graph_view) zawęża szukanie; indeks ALT pełnego grafu
+    (albo regionu, z którego wycięto podgraf) pozostaje dla niego poprawnym dolnym ograniczeniem.
+    """
+    graph = G if search_graph is None else search_graph
+    index = get_alt_index(G)
+    if index is None:
+        return nx.shortest_path(graph, start_node, end_node, weight=weight)
+    return nx.astar_path(graph, start_node, end_node, heuristic=alt_heuristic(G, index, end_node), weight=weight)
 
 def get_user_input() -> Tuple[float, float, float]:
     """
@@ -325,82 +1956,276 @@ def get_user_input() -> Tuple[float, float, float]:
 
     return route_length_km * 1000, start_lon, start_lat  # Zwraca w metrach
 
+class RouteCandidate:
+    """
+    Wynik jednego kandydata (proporcji/kształtu). Trasa i wierzchołki trzymane są w tablicach numpy,
+    a współrzędne trasy liczone dopiero na żądanie (route_coords) - zwykle tylko dla zwycięzcy.
+    Kandydat odrzucony przez ograniczenie długości ma pruned=True i length_lower_bound.
+    """
+
+    __slots__ = (
+        'proportion_name', 'proportion_denominator', 'target_length', 'sides', 'rotation',
+        'square_perimeter', 'side_length', 'corners', 'route_nodes', 'actual_length',
+        'surfaces', 'bike_type', 'disallowed_surfaces', 'length_difference', 'length_difference_percent',
+        'success', 'pruned', 'length_lower_bound', '_route_coords',
+    )
+
+    def __init__(self, proportion_name: str, proportion_denominator: float, target_length: float,
+                 sides: int = 4, rotation: float = 0.0, square_perimeter: float = 0.0, side_length: float = 0.0,
+                 corners: np.ndarray = None, route_nodes: np.ndarray = None, actual_length: float = 0.0,
+                 surfaces: Tuple[str, ...] = (), bike_type: str = None, disallowed_surfaces: Tuple[str, ...] = (),
+                 success: bool = False, pruned: bool = False, length_lower_bound: float = None):
+        self.proportion_name = proportion_name
+        self.proportion_denominator = proportion_denominator
+        self.target_length = target_length
+        self.sides = sides
+        self.rotation = rotation
+        self.square_perimeter = square_perimeter
+        self.side_length = side_length
+        self.corners = corners
+        self.route_nodes = route_nodes
+        self.actual_length = actual_length
+        self.surfaces = surfaces
+        self.bike_type = bike_type
+        self.disallowed_surfaces = disallowed_surfaces
+        self.length_difference = abs(actual_length - target_length)
+        self.length_difference_percent = self.length_difference / target_length * 100
+        self.success = success
+        self.pruned = pruned
+        self.length_lower_bound = length_lower_bound
+        self._route_coords = None
+
+    def __getstate__(self):
+        # Bez współrzędnych - proces główny policzy je dla zwycięzcy
+        return tuple(None if name == '_route_coords' else getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def route_coords(self, G) -> np.ndarray:
+        """
+        Współrzędne trasy jako tablica [lat, lon] (liczone przy pierwszym użyciu).
+        """
+        if self._route_coords is None:
+            self._route_coords = route_coordinates(G, self.route_nodes.tolist())[:, ::-1]
+        return self._route_coords
+
 def generate_route_for_proportion(G, start_lon: float, start_lat: float, 
                                 target_route_length: float, proportion_denominator: float, 
-                                proportion_name: str) -> Dict:
+                                proportion_name: str, corner_nodes: List[int] = None,
+                                sides: int = 4, rotation: float = 0.0, max_length: float = None,
+                                bike_type: str = None, length_bounds: List[float] = None) -> RouteCandidate:
     """
     Generuje trasę dla danej proporcji i zwraca szczegóły.
+    sides/rotation pozwalają zamiast kwadratu użyć innego (obróconego) wielokąta o tym samym obwodzie.
+    max_length (np. długość docelowa + różnica najlepszego dotąd kandydata) pozwala przerwać
+    liczenie kandydata, który na pewno będzie gorszy - wynik ma wtedy 'pruned': True.
+    bike_type sprawia, że trasa od razu omija nawierzchnie nieodpowiednie dla danego roweru.
+    length_bounds zbiera dolne ograniczenia długości, żeby przerwanie dało się odtworzyć później.
     """
     print(f"
 --- Generowanie trasy dla proporcji 10:{proportion_denominator} ---")
     
-    # Oblicz wymiary kwadratu
+    # Oblicz wymiary kwadratu (dla innych wielokątów obwód dzielimy na ich liczbę boków)
     square_perimeter, side_length = calculate_square_dimensions(target_route_length, proportion_denominator)
+    side_length = square_perimeter / sides
     
     print(f"Proporcja: 10:{proportion_denominator}")
     print(f"Obwód kwadratu: {square_perimeter/1000:.1f} km")
     print(f"Długość boku kwadratu: {side_length:.0f} m")
     
     # Wygeneruj wierzchołki kwadratu
-    corners = calculate_square_corners(start_lon, start_lat, side_length)
+    corners = calculate_polygon_corners(start_lon, start_lat, side_length, sides, rotation)
     
     # Znajdź okrężną trasę
-    route_nodes = find_circular_route(G, corners)
+    try:
+        route_nodes = find_circular_route(G, corners, corner_nodes, max_length, bike_type, length_bounds)
+    except CandidatePruned as e:
+        print(f"Kandydat odrzucony - trasa byłaby dłuższa niż {e.lower_bound/1000:.1f} km")
+        return RouteCandidate(proportion_name, proportion_denominator, target_route_length, sides, rotation,
+                              length_lower_bound=e.lower_bound, pruned=True)
     
     if not route_nodes:
         print(f"Nie udało się znaleźć kompletnej trasy dla proporcji 10:{proportion_denominator}")
         return None
     
-    # Oblicz rzeczywistą długość trasy
+    # Oblicz rzeczywistą długość trasy i zbierz nawierzchnie
     actual_route_length = calculate_route_length(G, route_nodes)
+    with profiler.span("route_surfaces"):
+        surfaces = route_surfaces(G, route_nodes)
     
-    # Oblicz różnicę względem docelowej długości
-    length_difference = abs(actual_route_length - target_route_length)
-    length_difference_percent = (length_difference / target_route_length) * 100
-    
-    # Konwersja na współrzędne
-    nodes_df, edges_df = ox.graph_to_gdfs(G)
-    route_coords = []
-    
-    for node in route_nodes:
-        if node in nodes_df.index:
-            lat = nodes_df.loc[node].y
-            lon = nodes_df.loc[node].x
-            route_coords.append((lat, lon))
-    
-    result = {
-        'proportion_name': proportion_name,
-        'proportion_denominator': proportion_denominator,
-        'target_length': target_route_length,
-        'actual_length': actual_route_length,
-        'square_perimeter': square_perimeter,
-        'side_length': side_length,
-        'corners': corners,
-        'route_nodes': route_nodes,
-        'route_coords': route_coords,
-        'length_difference': length_difference,
-        'length_difference_percent': length_difference_percent,
-        'success': True
-    }
+    # Współrzędne trasy nie są tu liczone - RouteCandidate.route_coords robi to dopiero dla zwycięzcy
+    result = RouteCandidate(
+        proportion_name, proportion_denominator, target_route_length, sides, rotation,
+        square_perimeter=square_perimeter,
+        side_length=side_length,
+        corners=np.array(corners, dtype=np.float64),
+        route_nodes=np.array(route_nodes, dtype=np.int64),
+        actual_length=actual_route_length,
+        surfaces=tuple(sorted(surfaces)),
+        bike_type=bike_type,
+        disallowed_surfaces=tuple(disallowed_surfaces(surfaces, bike_type)) if bike_type else (),
+        success=True,
+    )
     
     print(f"Rzeczywista długość trasy: {actual_route_length/1000:.1f} km")
-    print(f"Różnica względem docelowej: {length_difference/1000:.1f} km ({length_difference_percent:.1f}%)")
+    print(f"Różnica względem docelowej: {result.length_difference/1000:.1f} km ({result.length_difference_percent:.1f}%)")
+    if result.disallowed_surfaces:
+        print(f"Niedozwolone nawierzchnie dla roweru typu {bike_type}: {', '.join(result.disallowed_surfaces)}")
     
     return result
 
-def save_best_route(best_result: Dict, start_lon: float, start_lat: float, all_results: List[Dict]):
+# Zapis wyników: zwarty GeoJSON z zadaną dokładnością współrzędnych oraz formaty dla klientów
+# niepotrzebujących czytelnych plików
+GEOJSON_PRECISION = 6  # miejsca po przecinku (ok. 0.1 m)
+POLYLINE_PRECISION = 5  # standardowy "encoded polyline"
+OUTPUT_FORMATS = {
+    "geojson": ".geojson",
+    "geojsonseq": ".geojsons",
+    "polyline": ".polyline",
+    "fgb": ".fgb",
+}
+
+def encode_coordinates(coordinates: np.ndarray, precision: int = GEOJSON_PRECISION) -> str:
+    """
+    Tablica współrzędnych jako tekst JSON, zaokrąglona do precision miejsc po przecinku.
+    """
+    return json.dumps(np.round(coordinates, precision).tolist(), separators=(",", ":"))
+
+def round_coordinates(coordinates, precision: int = GEOJSON_PRECISION):
+    """
+    Zaokrągla współrzędne zapisane jako (zagnieżdżone) listy.
+    """
+    if isinstance(coordinates, (list, tuple)):
+        return [round_coordinates(value, precision) for value in coordinates]
+    return round(coordinates, precision) if isinstance(coordinates, float) else coordinates
+
+def dumps_geojson(geojson_data: Dict, precision: int = GEOJSON_PRECISION) -> str:
+    """
+    Zwarty GeoJSON (bez wcięć i spacji), wszystkie współrzędne zaokrąglone do precision miejsc.
+    Geometrie, których współrzędne są tablicami numpy, są kodowane bezpośrednio z tablicy
+    i wstawiane do gotowego tekstu.
+    """
+    encoded = []
+
+    def with_placeholder(geometry):
+        coordinates = geometry.get("coordinates") if geometry else None
+        if coordinates is None:
+            return geometry
+        if not isinstance(coordinates, np.ndarray):
+            return dict(geometry, coordinates=round_coordinates(coordinates, precision))
+        encoded.append(encode_coordinates(coordinates, precision))
+        return dict(geometry, coordinates=f"\x00{len(encoded) - 1}\x00")
+
+    if "features" in geojson_data:
+        data = dict(geojson_data, features=[
+            dict(feature, geometry=with_placeholder(feature.get("geometry")))
+            for feature in geojson_data["features"]
+        ])
+    elif "geometry" in geojson_data:
+        data = dict(geojson_data, geometry=with_placeholder(geojson_data["geometry"]))
+    else:
+        data = geojson_data
+
+    text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return re.sub(r'"\\u0000(\d+)\\u0000"', lambda match: encoded[int(match.group(1))], text)
+
+def dumps_geojson_seq(geojson_data: Dict, precision: int = GEOJSON_PRECISION) -> str:
+    """
+    GeoJSON Text Sequence (RFC 8142): każdy obiekt Feature w osobnym rekordzie.
+    """
+    return "".join("\x1e" + dumps_geojson(feature, precision) + "\n" for feature in geojson_data["features"])
+
+def encode_polyline(coordinates: np.ndarray, precision: int = POLYLINE_PRECISION) -> str:
+    """
+    Kodowanie "encoded polyline" (Google) dla współrzędnych [lat, lon].
+    """
+    values = np.round(np.asarray(coordinates, dtype=np.float64) * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    deltas = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    chars = []
+    for value in deltas.tolist():
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return "".join(chars)
+
+def write_flatgeobuf(output_file: str, geojson_data: Dict):
+    """
+    Zapis do FlatGeobuf (wymaga geopandas z pyogrio lub fiona). Właściwości, które nie są
+    liczbami ani tekstem, zapisywane są jako tekst JSON.
+    """
+    import geopandas as gpd
+    from shapely.geometry import shape
+
+    rows = []
+    for feature in geojson_data["features"]:
+        row = {
+            name: value if value is None or isinstance(value, (int, float, str)) else json.dumps(value, ensure_ascii=False)
+            for name, value in feature["properties"].items()
+        }
+        row["geometry"] = shape(feature["geometry"])
+        rows.append(row)
+    gpd.GeoDataFrame(rows, geometry="geometry", crs="EPSG:4326").to_file(output_file, driver="FlatGeobuf")
+
+def write_route_output(output_file: str, geojson_data: Dict, output_format: str = "geojson",
+                       precision: int = GEOJSON_PRECISION):
+    """
+    Zapisuje GeoJSON trasy w wybranym formacie. "polyline" zapisuje tylko linię trasy.
+    precision dotyczy formatów tekstowych - FlatGeobuf przechowuje pełne współrzędne.
+    """
+    if output_format == "fgb":
+        write_flatgeobuf(output_file, geojson_data)
+        return
+
+    if output_format == "geojson":
+        text = dumps_geojson(geojson_data, precision)
+    elif output_format == "geojsonseq":
+        text = dumps_geojson_seq(geojson_data, precision)
+    elif output_format == "polyline":
+        route_coordinates_lonlat = np.asarray(geojson_data["features"][0]["geometry"]["coordinates"])
+        text = encode_polyline(route_coordinates_lonlat[:, ::-1], min(precision, POLYLINE_PRECISION)) + "\n"
+    else:
+        raise ValueError(f"Nieznany format wyjściowy: {output_format}")
+
+    with open(output_file, "w", encoding='utf-8') as f:
+        f.write(text)
+
+def save_best_route(G, best_result: RouteCandidate, start_lon: float, start_lat: float,
+                    all_results: List[RouteCandidate], output_format: str = "geojson",
+                    precision: int = GEOJSON_PRECISION):
     """
-    Zapisuje najlepszą trasę do pliku GeoJSON wraz z informacjami porównawczymi.
+    Zapisuje najlepszą trasę do pliku GeoJSON wraz z informacjami porównawczymi
+    (albo w jednym z formatów OUTPUT_FORMATS).
     """
     if not best_result:
         print("Brak udanych tras do zapisania")
         return
     
-    output_file = f"best_circular_route.geojson"
+    output_file = f"best_circular_route{OUTPUT_FORMATS[output_format]}"
     
+    geojson_data = build_route_geojson(G, best_result, start_lon, start_lat, all_results)
+    
+    with profiler.span("write_geojson"):
+        write_route_output(output_file, geojson_data, output_format, precision)
+    
+    print(f"
+Najlepsza trasa zapisana do: {output_file}")
+    return output_file
+
+@profiled("geojson")
+def build_route_geojson(G, best_result: RouteCandidate, start_lon: float, start_lat: float,
+                        all_results: List[RouteCandidate]) -> Dict:
+    """
+    Buduje GeoJSON najlepszej trasy wraz z informacjami porównawczymi.
+    """
     # Tworzymy listę punktów wierzchołków kwadratu
     corner_features = []
-    for i, (lon, lat) in enumerate(best_result['corners']):
+    corners = best_result.corners.tolist()
+    for i, (lon, lat) in enumerate(corners):
         corner_features.append({
             "type": "Feature",
             "geometry": {
@@ -419,8 +2244,8 @@ def save_best_route(best_result: Dict, start_lon: float, start_lat: float, all_r
     comparison_text = "Porównanie proporcji:
 "
     for result in all_results:
-        if result and result.get('success'):
-            comparison_text += f"10:{result['proportion_denominator']}: {result['actual_length']/1000:.1f}km (różnica: {result['length_difference_percent']:.1f}%)
+        if result and result.success:
+            comparison_text += f"{result.proportion_name}: {result.actual_length/1000:.1f}km (różnica: {result.length_difference_percent:.1f}%)
 "
     
     geojson_data = {
@@ -430,16 +2255,22 @@ def save_best_route(best_result: Dict, start_lon: float, start_lat: float, all_r
                 "type": "Feature",
                 "geometry": {
                     "type": "LineString",
-                    "coordinates": [(lon, lat) for lat, lon in best_result['route_coords']]
+                    "coordinates": best_result.route_coords(G)[:, ::-1]  # kodowane przez dumps_geojson
                 },
                 "properties": {
-                    "name": f"Okrężna trasa rowerowa - proporcja 10:{best_result['proportion_denominator']}",
-                    "length_m": round(best_result['actual_length']),
-                    "description": f"Ścieżka rowerowa {best_result['actual_length']/1000:.1f}km zaczynająca się i kończąca w tym samym punkcie. {comparison_text}",
+                    "name": f"Okrężna trasa rowerowa - {best_result.proportion_name}",
+                    "length_m": round(best_result.actual_length),
+                    "description": f"Ścieżka rowerowa {best_result.actual_length/1000:.1f}km zaczynająca się i kończąca w tym samym punkcie. {comparison_text}",
                     "start_point": f"{start_lon}, {start_lat}",
-                    "target_length": f"{best_result['target_length']/1000:.1f} km",
-                    "proportion": f"10:{best_result['proportion_denominator']}",
-                    "length_difference_percent": round(best_result['length_difference_percent'], 1),
+                    "target_length": f"{best_result.target_length/1000:.1f} km",
+                    "proportion": f"10:{best_result.proportion_denominator}",
+                    "shape": best_result.proportion_name,
+                    "sides": best_result.sides,
+                    "rotation": best_result.rotation,
+                    "length_difference_percent": round(best_result.length_difference_percent, 1),
+                    "surfaces": list(best_result.surfaces),
+                    "bike_type": best_result.bike_type,
+                    "disallowed_surfaces": list(best_result.disallowed_surfaces),
                     "stroke": "#0000FF",
                     "stroke-width": 4
                 }
@@ -462,11 +2293,11 @@ def save_best_route(best_result: Dict, start_lon: float, start_lat: float, all_r
                 "type": "Feature",
                 "geometry": {
                     "type": "LineString",
-                    "coordinates": best_result['corners'] + [best_result['corners'][0]]  # Zamykamy kwadrat
+                    "coordinates": corners + [corners[0]]  # Zamykamy kwadrat
                 },
                 "properties": {
-                    "name": "Kształt kwadratu",
-                    "description": f"Teoretyczny kształt kwadratu {best_result['square_perimeter']/1000:.1f}km (4 x {best_result['side_length']/1000:.1f}km)",
+                    "name": f"Kształt: {best_result.proportion_name}",
+                    "description": f"Teoretyczny kształt kwadratu {best_result.square_perimeter/1000:.1f}km ({best_result.sides} x {best_result.side_length/1000:.1f}km)",
                     "stroke": "#FF0000",
                     "stroke-width": 2,
                     "stroke-dasharray": "5,5"
@@ -475,14 +2306,9 @@ def save_best_route(best_result: Dict, start_lon: float, start_lat: float, all_r
         ] + corner_features  # Dodajemy wszystkie wierzchołki
     }
     
-    with open(output_file, "w", encoding='utf-8') as f:
-        json.dump(geojson_data, f, ensure_ascii=False, indent=2)
-    
-    print(f"
-Najlepsza trasa zapisana do: {output_file}")
-    return output_file
+    return geojson_data
 
-def print_comparison_table(all_results: List[Dict], target_length: float):
+def print_comparison_table(all_results: List[RouteCandidate], target_length: float):
     """
     Wyświetla tabelę porównawczą wszystkich proporcji.
     """
@@ -490,30 +2316,31 @@ def print_comparison_table(all_results: List[Dict], target_length: float):
 " + "="*80)
     print("PORÓWNANIE WSZYSTKICH PROPORCJI")
     print("="*80)
-    print(f"{'Proporcja':<12} {'Długość trasy':<15} {'Różnica':<12} {'Odchylenie':<12} {'Status':<10}")
+    print(f"{'Kształt i proporcja':<26} {'Długość trasy':<15} {'Różnica':<12} {'Odchylenie':<12} {'Status':<10}")
     print("-"*80)
     
     successful_results = []
     
     for result in all_results:
-        if result and result.get('success'):
+        if result and result.success:
             successful_results.append(result)
             status = "SUKCES"
-            print(f"10:{result['proportion_denominator']:<10} {result['actual_length']/1000:6.1f} km     {result['length_difference']/1000:5.1f} km     {result['length_difference_percent']:5.1f}%       {status:<10}")
+            print(f"{result.proportion_name:<26} {result.actual_length/1000:6.1f} km     {result.length_difference/1000:5.1f} km     {result.length_difference_percent:5.1f}%       {status:<10}")
         else:
-            proportion = result['proportion_denominator'] if result else '?'
-            print(f"10:{proportion:<10} {'-':<15} {'-':<12} {'-':<12} {'BRAK':<10}")
+            proportion = result.proportion_name if result else '?'
+            status = "ODRZUCONA" if result and result.pruned else "BRAK"
+            print(f"{proportion:<26} {'-':<15} {'-':<12} {'-':<12} {status:<10}")
     
     print("-"*80)
     
     if successful_results:
         # Znajdź najlepszy wynik (najmniejsza różnica)
-        best_result = min(successful_results, key=lambda x: x['length_difference_percent'])
+        best_result = select_best_result(successful_results)
         
         print(f"
-NAJLEPSZA PROPORCJA: 10:{best_result['proportion_denominator']}")
-        print(f"Długość trasy: {best_result['actual_length']/1000:.1f} km")
-        print(f"Różnica względem docelowej ({target_length/1000:.1f} km): {best_result['length_difference']/1000:.1f} km ({best_result['length_difference_percent']:.1f}%)")
+NAJLEPSZA PROPORCJA: {best_result.proportion_name}")
+        print(f"Długość trasy: {best_result.actual_length/1000:.1f} km")
+        print(f"Różnica względem docelowej ({target_length/1000:.1f} km): {best_result.length_difference/1000:.1f} km ({best_result.length_difference_percent:.1f}%)")
         
         return best_result
     else:
@@ -521,7 +2348,811 @@ NAJLEPSZA PROPORCJA: 10:{best_result['proportion_denominator']}")
 Żadna proporcja nie wygenerowała udanej trasy")
         return None
 
-def main():
+def select_best_result(all_results: List[RouteCandidate]) -> RouteCandidate:
+    """
+    Zwraca udany wynik z najmniejszą różnicą względem docelowej długości (albo None).
+    """
+    successful_results = [result for result in all_results if result and result.success]
+    if not successful_results:
+        return None
+    return min(successful_results, key=lambda x: x.length_difference_percent)
+
+# Graf dla procesów roboczych - przekazywany przez fork, bez serializacji w każdym zadaniu
+_worker_graph = None
+
+def _evaluate_proportion_in_worker(task: Dict) -> Tuple[RouteCandidate, List[float]]:
+    length_bounds = []
+    return generate_route_for_proportion(_worker_graph, **task, length_bounds=length_bounds), length_bounds
+
+def evaluate_proportions(G, start_lon: float, start_lat: float, target_route_length: float,
+                         proportions: List[Tuple[float, str]], workers: int = 1,
+                         bike_type: str = None) -> List[RouteCandidate]:
+    """
+    Generuje trasy dla wszystkich proporcji. Przy workers > 1 kandydaci są liczeni
+    równolegle w procesach potomnych (tylko tam, gdzie dostępny jest fork).
+    Kolejność wyników odpowiada kolejności proporcji. Procesy potomne liczą kandydatów bez
+    ograniczenia długości, a przerwanie względem najlepszego wcześniejszego kandydata jest
+    odtwarzane po zebraniu wyników - oba tryby zwracają to samo.
+    """
+    global _worker_graph
+
+    # Wierzchołki wszystkich proporcji przyciągamy do grafu jednym zapytaniem
+    candidate_corners = [
+        calculate_square_corners(start_lon, start_lat,
+                                 calculate_square_dimensions(target_route_length, proportion_denominator)[1])
+        for proportion_denominator, _ in proportions
+    ]
+    snapped_nodes = snap_points_to_nodes(G, [corner for corners in candidate_corners for corner in corners])
+
+    offsets = np.cumsum([0] + [len(corners) for corners in candidate_corners]).tolist()
+    tasks = [
+        dict(start_lon=start_lon, start_lat=start_lat, target_route_length=target_route_length,
+             proportion_denominator=proportion_denominator, proportion_name=proportion_name,
+             corner_nodes=snapped_nodes[offsets[i]:offsets[i + 1]], bike_type=bike_type)
+        for i, (proportion_denominator, proportion_name) in enumerate(proportions)
+    ]
+
+    if workers > 1 and len(tasks) > 1 and "fork" in multiprocessing.get_all_start_methods():
+        _worker_graph = G
+        try:
+            with multiprocessing.get_context("fork").Pool(min(workers, len(tasks))) as pool:
+                evaluated = pool.map(_evaluate_proportion_in_worker, tasks)
+        finally:
+            _worker_graph = None
+
+        # To samo przerywanie co przy liczeniu po kolei: pierwsze dolne ograniczenie ponad
+        # długość najlepszego wcześniejszego kandydata odrzuca kandydata
+        all_results = []
+        for task, (result, length_bounds) in zip(tasks, evaluated):
+            best_result = select_best_result(all_results)
+            if best_result:
+                max_length = target_route_length + best_result.length_difference
+                lower_bound = next((bound for bound in length_bounds if bound > max_length), None)
+                if lower_bound is not None:
+                    print(f"Kandydat 10:{task['proportion_denominator']} odrzucony - trasa byłaby dłuższa "
+                          f"niż {lower_bound/1000:.1f} km")
+                    result = RouteCandidate(task['proportion_name'], task['proportion_denominator'],
+                                            target_route_length, length_lower_bound=lower_bound, pruned=True)
+            all_results.append(result)
+        return all_results
+
+    # Liczone po kolei - każdy kandydat może być przerwany względem najlepszego dotychczasowego
+    all_results = []
+    for task in tasks:
+        best_result = select_best_result(all_results)
+        max_length = target_route_length + best_result.length_difference if best_result else None
+        all_results.append(generate_route_for_proportion(G, **task, max_length=max_length))
+    return all_results
+
+# Adaptacyjne wyszukiwanie: kształt, obrót i skala dobierane na podstawie rzeczywistej długości trasy
+ADAPTIVE_SHAPES = [
+    (4, 0.0, "kwadrat"),
+    (4, 45.0, "romb"),
+    (3, 0.0, "trójkąt"),
+    (5, 0.0, "pięciokąt"),
+    (3, 180.0, "trójkąt odwrócony"),
+    (6, 30.0, "sześciokąt"),
+]
+ADAPTIVE_START_DENOMINATOR = 6.5
+ADAPTIVE_MIN_DENOMINATOR = 3.0
+ADAPTIVE_MAX_DENOMINATOR = 9.0
+
+def adaptive_route_search(G, start_lon: float, start_lat: float, target_route_length: float,
+                          tolerance_percent: float = 5.0, max_evaluations: int = 12,
+                          steps_per_shape: int = 4, shapes: List[Tuple] = ADAPTIVE_SHAPES,
+                          bike_type: str = None, workers: int = 1) -> List[RouteCandidate]:
+    """
+    Szuka trasy o długości zbliżonej do docelowej, zmieniając skalę wielokąta na podstawie
+    rzeczywistej długości poprzedniej próby (długość trasy jest w przybliżeniu proporcjonalna
+    do obwodu). Gdy skala jest już ograniczona z obu stron, używa bisekcji.
+    Kolejne kształty/obroty są próbowane tylko wtedy, gdy poprzedni nie zmieścił się w tolerancji.
+    Kończy po znalezieniu trasy w tolerancji lub po max_evaluations próbach; zwraca wszystkie wyniki.
+    Przy workers > 1 kształty są liczone równolegle, po workers naraz (patrz adaptive_search_parallel).
+    """
+    if workers > 1 and len(shapes) > 1 and "fork" in multiprocessing.get_all_start_methods():
+        return adaptive_search_parallel(G, start_lon, start_lat, target_route_length, tolerance_percent,
+                                        max_evaluations, steps_per_shape, shapes, bike_type, workers)
+
+    all_results = []
+
+    for sides, rotation, shape_name in shapes:
+        denominator = ADAPTIVE_START_DENOMINATOR
+        too_short, too_long = None, None  # najlepsze ograniczenia skali z dołu i z góry
+
+        for _ in range(steps_per_shape):
+            if len(all_results) >= max_evaluations:
+                return all_results
+
+            denominator = round(min(max(denominator, ADAPTIVE_MIN_DENOMINATOR), ADAPTIVE_MAX_DENOMINATOR), 2)
+            best_result = select_best_result(all_results)
+            max_length = target_route_length + best_result.length_difference if best_result else None
+            result = generate_route_for_proportion(
+                G, start_lon, start_lat, target_route_length, denominator,
+                f"{shape_name} 10:{denominator}", sides=sides, rotation=rotation, max_length=max_length,
+                bike_type=bike_type)
+            all_results.append(result)
+
+            if not result:
+                break
+            if result.success and result.length_difference_percent <= tolerance_percent:
+                return all_results
+
+            # Odrzucony kandydat jest na pewno za długi - jego dolne ograniczenie służy jako długość
+            route_length = result.actual_length if result.success else result.length_lower_bound
+            if route_length > target_route_length:
+                too_long = denominator if too_long is None else min(too_long, denominator)
+            else:
+                too_short = denominator if too_short is None else max(too_short, denominator)
+
+            # Sprzężenie zwrotne: skalujemy obwód o stosunek długości docelowej do rzeczywistej
+            next_denominator = denominator * target_route_length / max(route_length, 1.0)
+            if too_short is not None and too_long is not None and not too_short < next_denominator < too_long:
+                next_denominator = (too_short + too_long) / 2
+            # Skala przycięta do zakresu, która się nie zmienia, dałaby znów tego samego kandydata
+            next_denominator = round(min(max(next_denominator, ADAPTIVE_MIN_DENOMINATOR), ADAPTIVE_MAX_DENOMINATOR), 2)
+            if next_denominator == denominator:
+                break
+            denominator = next_denominator
+
+    return all_results
+
+def _adaptive_shape_in_worker(task: Dict) -> List[RouteCandidate]:
+    return adaptive_route_search(_worker_graph, **task)
+
+def adaptive_search_parallel(G, start_lon: float, start_lat: float, target_route_length: float,
+                             tolerance_percent: float, max_evaluations: int, steps_per_shape: int,
+                             shapes: List[Tuple], bike_type: str, workers: int) -> List[RouteCandidate]:
+    """
+    Wyszukiwanie adaptacyjne z kształtami liczonymi w procesach potomnych (fork), po workers
+    kształtów na rundę. Kolejna runda startuje tylko wtedy, gdy żaden wynik nie zmieścił się
+    w tolerancji i zostały jeszcze próby z max_evaluations. Wyniki są w kolejności kształtów.
+    """
+    global _worker_graph
+
+    all_results = []
+    _worker_graph = G
+    try:
+        with multiprocessing.get_context("fork").Pool(min(workers, len(shapes))) as pool:
+            for first in range(0, len(shapes), workers):
+                # Pozostałe próby dzielone między kształty rundy, żeby łącznie nie przekroczyć limitu
+                remaining = max_evaluations - len(all_results)
+                tasks = []
+                for shape in shapes[first:first + workers]:
+                    budget = min(steps_per_shape, remaining)
+                    if budget <= 0:
+                        break
+                    remaining -= budget
+                    tasks.append(dict(start_lon=start_lon, start_lat=start_lat,
+                                      target_route_length=target_route_length, tolerance_percent=tolerance_percent,
+                                      max_evaluations=budget, steps_per_shape=steps_per_shape, shapes=[shape],
+                                      bike_type=bike_type))
+                if not tasks:
+                    break
+                for shape_results in pool.map(_adaptive_shape_in_worker, tasks):
+                    all_results.extend(shape_results)
+
+                best_result = select_best_result(all_results)
+                if best_result and best_result.length_difference_percent <= tolerance_percent:
+                    break
+    finally:
+        _worker_graph = None
+    return all_results
+
+@profiled("search")
+def search_routes(G, start_lon: float, start_lat: float, target_route_length: float,
+                  search: str = "adaptive", workers: int = 1, bike_type: str = None) -> List[RouteCandidate]:
+    """
+    Generuje kandydatów: adaptacyjnie ("adaptive") albo dla stałych proporcji kwadratu ("fixed").
+    """
+    if search == "fixed":
+        return evaluate_proportions(G, start_lon, start_lat, target_route_length, DEFAULT_PROPORTIONS, workers,
+                                    bike_type)
+    return adaptive_route_search(G, start_lon, start_lat, target_route_length, bike_type=bike_type, workers=workers)
+
+# Tryb wsadowy - wiele zadań (start_lon, start_lat, target_km) z pliku CSV/JSONL lub stdin
+BATCH_GROUP_CELL = 0.1  # zadania z tej samej komórki siatki (w stopniach) dzielą jeden graf
+
+def read_route_jobs(source: str) -> List[Dict]:
+    """
+    Wczytuje zadania z pliku .csv / .jsonl albo ze standardowego wejścia ("-").
+    Format rozpoznawany jest po pierwszym znaku (JSONL zaczyna się od "{").
+    Niepoprawne wiersze nie przerywają wczytywania - zadanie dostaje pole 'error' z opisem.
+    """
+    stream = sys.stdin if source == "-" else open(source, "r", encoding='utf-8', newline='')
+    try:
+        lines = [line for line in stream if line.strip()]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    if not lines:
+        return []
+    if lines[0].lstrip().startswith("{"):
+        rows = []
+        for line in lines:
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                rows.append(None)
+    else:
+        rows = list(csv.DictReader(lines))
+
+    jobs = []
+    for number, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            jobs.append({'id': str(number), 'start_lon': None, 'start_lat': None, 'target_km': None,
+                         'bike_type': None, 'error': "Wiersz nie jest poprawnym obiektem JSON"})
+            continue
+
+        job = {
+            'id': row.get('id') or str(number),
+            'start_lon': row.get('start_lon'),
+            'start_lat': row.get('start_lat'),
+            'target_km': row.get('target_km'),
+            'bike_type': row.get('bike_type') or None,
+        }
+        try:
+            for name in ('start_lon', 'start_lat', 'target_km'):
+                if row.get(name) in (None, ""):
+                    raise ValueError(f"Brak pola {name}")
+                try:
+                    job[name] = float(row[name])
+                except (TypeError, ValueError):
+                    job[name] = None
+                if job[name] is None or not math.isfinite(job[name]):
+                    job[name] = row[name]
+                    raise ValueError(f"Niepoprawna wartość {name}: {row[name]}")
+            if job['target_km'] <= 0:
+                raise ValueError(f"target_km musi być dodatnie: {row['target_km']}")
+            bike_type = job['bike_type']
+            if bike_type is not None and not (isinstance(bike_type, str) and bike_type in bike_surface_rules):
+                raise ValueError(f"Nieznany typ roweru: {job['bike_type']}")
+        except ValueError as e:
+            job['error'] = str(e)
+        jobs.append(job)
+    return jobs
+
+def group_jobs_by_region(jobs: List[Dict]) -> Dict[Tuple[int, int], List[Dict]]:
+    """
+    Grupuje zadania według komórek siatki BATCH_GROUP_CELL.
+    """
+    groups = {}
+    for job in jobs:
+        cell = (int(math.floor(job['start_lat'] / BATCH_GROUP_CELL)),
+                int(math.floor(job['start_lon'] / BATCH_GROUP_CELL)))
+        groups.setdefault(cell, []).append(job)
+    return groups
+
+def route_result_record(G, job: Dict, best_result: RouteCandidate) -> Dict:
+    """
+    Wiersz wyniku zadania wsadowego (jedna linia JSONL).
+    """
+    record = {
+        'id': job['id'],
+        'start_lon': job['start_lon'],
+        'start_lat': job['start_lat'],
+        'target_km': job['target_km'],
+    }
+    if not best_result:
+        record['status'] = "no_route"
+        return record
+
+    record.update({
+        'status': "ok",
+        'actual_km': round(best_result.actual_length / 1000, 3),
+        'length_difference_percent': round(best_result.length_difference_percent, 1),
+        'proportion': f"10:{best_result.proportion_denominator}",
+        'shape': best_result.proportion_name,
+        'surfaces': list(best_result.surfaces),
+        'disallowed_surfaces': list(best_result.disallowed_surfaces),
+        'geometry': {
+            'type': "LineString",
+            'coordinates': best_result.route_coords(G)[:, ::-1].tolist(),
+        },
+    })
+    return record
+
+def run_batch(input_source: str, output_target: str, region: str = None,
+              workers: int = 1, use_alt: bool = False, search: str = "adaptive", bike_type: str = None) -> int:
+    """
+    Generuje trasy dla wszystkich zadań. Zadania z jednej komórki siatki korzystają
+    z jednego wczytanego grafu i jego indeksów. Wyniki są dopisywane na bieżąco jako JSONL.
+    Z podanym region każde zadanie dostaje podgraf regionu wokół swojego punktu startowego
+    (patrz subgraph_around_point); start poza regionem to błąd zadania, bez pobierania z sieci.
+    Kolumna bike_type zadania nadpisuje domyślny typ roweru.
+    Błąd w jednym zadaniu (niepoprawny wiersz, wyjątek przy szukaniu) daje wynik ze statusem
+    "error" i polem "error", a przetwarzanie idzie dalej. Zwraca liczbę przetworzonych zadań.
+    """
+    jobs = read_route_jobs(input_source)
+    out = sys.stdout if output_target == "-" else open(output_target, "w", encoding='utf-8')
+    # Komunikaty diagnostyczne nie mogą mieszać się z wynikami na stdout
+    log = sys.stderr if out is sys.stdout else sys.stdout
+
+    processed = 0
+
+    def write(record: Dict):
+        nonlocal processed
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        processed += 1
+
+    def error_record(job: Dict, message: str) -> Dict:
+        return dict(route_result_record(None, job, None), status="error", error=message)
+
+    def route_job(G, job: Dict):
+        try:
+            with contextlib.redirect_stdout(log):
+                all_results = search_routes(
+                    G, job['start_lon'], job['start_lat'], job['target_km'] * 1000,
+                    search, workers, job['bike_type'] or bike_type)
+            record = route_result_record(G, job, select_best_result(all_results))
+        except Exception as e:
+            print(f"Błąd zadania {job['id']}: {e}", file=log)
+            record = error_record(job, str(e))
+        write(record)
+
+    try:
+        for job in jobs:
+            if 'error' in job:
+                write(error_record(job, job['error']))
+
+        valid_jobs = [job for job in jobs if 'error' not in job]
+        if region:
+            for job in valid_jobs:
+                with contextlib.redirect_stdout(log):
+                    try:
+                        G = subgraph_around_point(region, job['start_lat'], job['start_lon'],
+                                                  calculate_search_radius(job['target_km'] * 1000))
+                        if G is not None:
+                            build_bike_edge_masks(G)
+                            if use_alt:
+                                get_alt_index(G, build=True)
+                    except Exception as e:
+                        print(f"Błąd ładowania regionu {region}: {e}")
+                        write(error_record(job, f"Błąd ładowania regionu: {e}"))
+                        continue
+                if G is None:
+                    write(error_record(job, f"Punkt startowy poza regionem {region}"))
+                else:
+                    route_job(G, job)
+        else:
+            for cell, group in group_jobs_by_region(valid_jobs).items():
+                center_lat = (cell[0] + 0.5) * BATCH_GROUP_CELL
+                center_lon = (cell[1] + 0.5) * BATCH_GROUP_CELL
+                radius = max(
+                    haversine_distance(center_lon, center_lat, job['start_lon'], job['start_lat']) +
+                    calculate_search_radius(job['target_km'] * 1000)
+                    for job in group
+                )
+
+                with contextlib.redirect_stdout(log):
+                    try:
+                        G = load_graph_for_area(center_lat, center_lon, radius, network_type="bike")
+                        if use_alt:
+                            get_alt_index(G, build=True)
+                    except Exception as e:
+                        print(f"Błąd ładowania mapy dla grupy {cell}: {e}")
+                        G, load_error = None, f"Błąd ładowania mapy: {e}"
+
+                for job in group:
+                    if G is None:
+                        write(error_record(job, load_error))
+                    else:
+                        route_job(G, job)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    with contextlib.redirect_stdout(log):
+        print_overpass_cache_stats()
+    return processed
+
+# Serwer HTTP tras - grafy, indeksy i pamięć ścieżek zostają w pamięci procesów roboczych
+SERVER_RESPONSE_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+def _float_param(params: Dict, name: str) -> float:
+    try:
+        return float(params[name])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Brak lub niepoprawny parametr: {name}")
+
+def _int_param(params: Dict, name: str) -> int:
+    try:
+        return int(params[name])
+    except (KeyError, TypeError, ValueError, OverflowError):
+        raise ValueError(f"Brak lub niepoprawny parametr: {name}")
+
+def _bike_type_param(params: Dict) -> str:
+    bike_type = params.get('bike_type') or None
+    if bike_type is not None and bike_type not in bike_surface_rules:
+        raise ValueError(f"Nieznany typ roweru: {bike_type} (dostępne: {', '.join(bike_surface_rules)})")
+    return bike_type
+
+def compute_circular_route_geojson(params: Dict, region: str = None) -> Dict:
+    """
+    Okrężna trasa dla zapytania {lon, lat, km[, bike_type]} - ten sam GeoJSON, który zapisuje save_best_route.
+    Zwraca None, gdy nie udało się wygenerować trasy.
+    """
+    start_lon = _float_param(params, 'lon')
+    start_lat = _float_param(params, 'lat')
+    target_route_length = _float_param(params, 'km') * 1000
+    if target_route_length <= 0:
+        raise ValueError("Długość trasy musi być większa od 0")
+    bike_type = _bike_type_param(params)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        G = load_graph_for_area(start_lat, start_lon, calculate_search_radius(target_route_length),
+                                region=region, network_type="bike")
+        all_results = search_routes(G, start_lon, start_lat, target_route_length, params.get('search', "adaptive"),
+                                    bike_type=bike_type)
+
+    best_result = select_best_result(all_results)
+    if not best_result:
+        return None
+    return build_route_geojson(G, best_result, start_lon, start_lat, all_results)
+
+def compute_point_to_point_geojson(params: Dict, region: str = None) -> Dict:
+    """
+    Trasa z punktu do punktu dla zapytania {from_lon, from_lat, to_lon, to_lat[, bike_type]}.
+    """
+    from_lon, from_lat = _float_param(params, 'from_lon'), _float_param(params, 'from_lat')
+    to_lon, to_lat = _float_param(params, 'to_lon'), _float_param(params, 'to_lat')
+    bike_type = _bike_type_param(params)
+
+    # Okrąg obejmujący oba punkty z zapasem
+    radius = haversine_distance(from_lon, from_lat, to_lon, to_lat) * 0.75 + 1000
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        G = load_graph_for_area((from_lat + to_lat) / 2, (from_lon + to_lon) / 2, radius,
+                                region=region, network_type="bike")
+
+    orig, dest = snap_points_to_nodes(G, [(from_lon, from_lat), (to_lon, to_lat)])
+    try:
+        path = find_point_to_point_path(G, orig, dest, bike_type)
+    except nx.NetworkXNoPath:
+        return None
+    surfaces = route_surfaces(G, path)
+
+    return {
+        "type": "FeatureCollection",
+        "features": [{
+            "type": "Feature",
+            "geometry": {
+                "type": "LineString",
+                "coordinates": route_coordinates(G, path).tolist()
+            },
+            "properties": {
+                "length_m": round(calculate_route_length(G, path), 2),
+                "surfaces": sorted(surfaces),
+                "bike_type": bike_type,
+                "disallowed_surfaces": disallowed_surfaces(surfaces, bike_type) if bike_type else []
+            }
+        }]
+    }
+
+SERVER_ROUTES = {
+    "/route/circular": compute_circular_route_geojson,
+    "/route/p2p": compute_point_to_point_geojson,
+}
+
+def _run_server_route(path: str, params: Dict, region: str = None) -> Tuple:
+    """
+    Wykonuje zapytanie w procesie roboczym z włączonymi pomiarami etapów.
+    Zwraca (wynik, sumy etapów, odcinki, raport cProfile albo None) - proces główny
+    dolicza sumy do /metrics i dopisuje odcinki do śladu.
+    """
+    profiler.reset()
+    profiler.enabled = True
+    try:
+        if str(params.get('profile', "")).lower() in ("1", "true"):
+            result, report = profile_call(SERVER_ROUTES[path], params, region)
+        else:
+            result, report = SERVER_ROUTES[path](params, region), None
+        return result, profiler.totals, profiler.spans, report
+    finally:
+        profiler.enabled = False
+
+async def _handle_http_request(reader, writer, executor, region: str = None, metrics: Dict = None):
+    """
+    Obsługuje jedno zapytanie HTTP/1.1 (parametry w query stringu lub w treści JSON).
+    Obliczenia trafiają do puli procesów, więc pętla zdarzeń obsługuje kolejne połączenia.
+    metrics zbiera liczniki zapytań i czasy etapów dla /metrics (oraz opcjonalnie plik śladu).
+    """
+    metrics = {'requests': {}, 'trace': None} if metrics is None else metrics
+    status, payload = 500, {"error": "Błąd serwera"}
+    path = None
+    precision = GEOJSON_PRECISION
+    try:
+        request_line = (await reader.readline()).decode('latin-1')
+        method, target, _ = request_line.split(" ", 2)
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        url = urllib.parse.urlsplit(target)
+        path = url.path
+        params = {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()}
+        content_length = int(headers.get("content-length") or 0)
+        if content_length:
+            body = json.loads(await reader.readexactly(content_length))
+            if not isinstance(body, dict):
+                raise ValueError("Treść zapytania musi być obiektem JSON")
+            params.update(body)
+        if 'precision' in params:
+            precision = min(max(_int_param(params, 'precision'), 0), 10)
+
+        if url.path == "/health":
+            status, payload = 200, {"status": "ok"}
+        elif url.path == "/metrics":
+            status, payload = 200, prometheus_metrics(profiler.totals, metrics['requests'])
+        elif url.path not in SERVER_ROUTES or method not in ("GET", "POST"):
+            status, payload = 404, {"error": f"Nieznany adres: {method} {url.path}"}
+        else:
+            loop = asyncio.get_running_loop()
+            result, totals, spans, report = await loop.run_in_executor(
+                executor, _run_server_route, url.path, params, region)
+            profiler.merge_totals(totals)
+            if metrics['trace']:
+                profiler.write_trace(metrics['trace'], spans, endpoint=url.path)
+            if result is None:
+                status, payload = 404, {"error": "Nie udało się wyznaczyć trasy"}
+            else:
+                status, payload = 200, result
+            if report is not None:
+                payload = dict(payload, profile=report)
+    except ValueError as e:
+        status, payload = 400, {"error": str(e)}
+    except Exception as e:
+        print(f"Błąd obsługi zapytania: {e}", file=sys.stderr)
+
+    key = (path if path in SERVER_ROUTES or path in ("/health", "/metrics") else "other", status)
+    metrics['requests'][key] = metrics['requests'].get(key, 0) + 1
+
+    if isinstance(payload, str):
+        body = payload.encode('utf-8')
+        content_type = "text/plain; version=0.0.4"
+    else:
+        body = dumps_geojson(payload, precision).encode('utf-8')
+        content_type = "application/geo+json" if status == 200 and "features" in payload else "application/json"
+    writer.write(
+        f"HTTP/1.1 {status} {SERVER_RESPONSE_REASONS[status]}\r\n"
+        f"Content-Type: {content_type}; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n".encode('latin-1') + body
+    )
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+def server_worker_count(workers: int = None) -> int:
+    """
+    Liczba procesów roboczych serwera: podana albo (domyślnie) liczba procesorów.
+    """
+    return workers or os.cpu_count() or 1
+
+async def serve_routes(host: str = "127.0.0.1", port: int = 8080, workers: int = None, region: str = None,
+                       trace: str = None):
+    """
+    Uruchamia serwer tras. Każdy proces roboczy trzyma wczytane grafy i ich indeksy
+    między zapytaniami, więc kolejne trasy w tym samym regionie nie wczytują grafu ponownie.
+    Czasy etapów są dostępne pod /metrics, a przy podanym trace dopisywane do pliku JSONL.
+    """
+    workers = server_worker_count(workers)
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    metrics = {'requests': {}, 'trace': trace}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        server = await asyncio.start_server(
+            lambda reader, writer: _handle_http_request(reader, writer, executor, region, metrics), host, port)
+        print(f"Serwer tras działa na http://{host}:{port} (procesy robocze: {workers})")
+        async with server:
+            await server.serve_forever()
+
+# Testy wydajności na stałych grafach, bez dostępu do sieci
+# Kopia odpowiedzi Overpass dla Chorzowa poza katalogiem cache/ - pamięć podręczna jej nie usunie
+BENCH_CHORZOW_FIXTURE = os.path.join("bench_fixtures", "chorzow_overpass.json.gz")
+BENCH_TARGETS_KM = [5, 10, 20, 50, 100]
+BENCH_GRID_SIZE = 200  # węzłów na bok siatki
+BENCH_GRID_SPACING = 250.0  # metry między sąsiednimi węzłami
+
+def synthetic_grid_graph(size: int = BENCH_GRID_SIZE, spacing: float = BENCH_GRID_SPACING,
+                         origin: Tuple[float, float] = (18.9, 50.25), seed: int = 0):
+    """
+    Siatka size x size węzłów (drogi w obu kierunkach) z losowymi, ale powtarzalnymi nawierzchniami.
+    """
+    rng = random.Random(seed)
+    lon0, lat0 = origin
+    dlat = spacing / 111320.0
+    dlon = spacing / (111320.0 * math.cos(math.radians(lat0)))
+
+    G = nx.MultiDiGraph(crs="epsg:4326", name=f"grid_{size}x{size}")
+    G.add_nodes_from(
+        (row * size + col, {'x': lon0 + col * dlon, 'y': lat0 + row * dlat})
+        for row in range(size) for col in range(size)
+    )
+    for row in range(size):
+        for col in range(size):
+            node = row * size + col
+            for neighbor in ([node + 1] if col + 1 < size else []) + ([node + size] if row + 1 < size else []):
+                attrs = {'length': spacing, 'highway': "residential"}
+                surface = rng.choice(["asphalt", "asphalt", "paving_stones", "gravel", None])
+                if surface:
+                    attrs['surface'] = surface
+                G.add_edge(node, neighbor, **attrs)
+                G.add_edge(neighbor, node, **attrs)
+    return G
+
+def load_bench_fixture(name: str):
+    """
+    Graf testowy: "chorzow" (zapisana odpowiedź Overpass z katalogu bench_fixtures/) albo "grid".
+    """
+    if name == "chorzow":
+        with gzip.open(BENCH_CHORZOW_FIXTURE, "rt", encoding='utf-8') as f:
+            return graph_from_overpass_responses([json.load(f)], "bike")
+    if name == "grid":
+        return synthetic_grid_graph()
+    raise ValueError(f"Nieznany graf testowy: {name}")
+
+def _time_stage(fn, repeat: int, setup=None):
+    """
+    Zwraca (wynik, najkrótszy czas z repeat wywołań). setup jest wołany przed każdym pomiarem.
+    """
+    best, result = math.inf, None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+def _peak_memory(fn, setup=None) -> int:
+    """
+    Szczytowa ilość pamięci zaalokowanej przez fn (tracemalloc, w bajtach).
+    """
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def benchmark_route_stages(G, start_lon: float, start_lat: float, target_km: float,
+                           repeat: int = 3, memory: bool = True) -> Dict[str, Dict]:
+    """
+    Mierzy kolejne etapy generowania trasy dla proporcji 10:7 (przyciąganie wierzchołków,
+    wyznaczanie trasy, długość, współrzędne, GeoJSON) oraz całe wyszukiwanie adaptacyjne.
+    Pamięć ścieżek jest czyszczona przed każdym pomiarem, więc trasa liczona jest "na zimno".
+    """
+    target = target_km * 1000
+    proportion_denominator, proportion_name = DEFAULT_PROPORTIONS[0]
+    side_length = calculate_square_dimensions(target, proportion_denominator)[1]
+    corners = calculate_square_corners(start_lon, start_lat, side_length)
+
+    def reset_paths():
+        _graph_cache(G).pop('path_cache', None)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # Każdy etap dostaje gotowe wyniki poprzednich - mierzona jest tylko jego własna praca
+        measured = {"snap": (lambda: snap_points_to_nodes(G, corners), None)}
+        corner_nodes = snap_points_to_nodes(G, corners)
+        measured["route"] = (lambda: find_circular_route(G, corners, corner_nodes), reset_paths)
+
+        route_nodes = find_circular_route(G, corners, corner_nodes)
+        if route_nodes:
+            result = generate_route_for_proportion(G, start_lon, start_lat, target, proportion_denominator,
+                                                   proportion_name, corner_nodes)
+            measured["length"] = (lambda: calculate_route_length(G, route_nodes), None)
+            measured["coordinates"] = (lambda: route_coordinates(G, route_nodes)[:, ::-1], None)
+            measured["serialization"] = (
+                lambda: dumps_geojson(build_route_geojson(G, result, start_lon, start_lat, [result])),
+                None)
+        measured["search"] = (lambda: search_routes(G, start_lon, start_lat, target), reset_paths)
+
+        records = {}
+        for stage, (fn, setup) in measured.items():
+            _, seconds = _time_stage(fn, repeat, setup)
+            records[stage] = {'seconds': seconds}
+            if memory:
+                records[stage]['peak_bytes'] = _peak_memory(fn, setup)
+    return records
+
+def run_benchmarks(fixtures: List[str], targets_km: List[float], repeat: int = 3, memory: bool = True) -> Dict:
+    """
+    Uruchamia testy wydajności i zwraca wyniki w formacie JSON (jeden rekord na graf, długość i etap).
+    """
+    results = []
+    for fixture in fixtures:
+        started = time.perf_counter()
+        G = load_bench_fixture(fixture)
+        build_seconds = time.perf_counter() - started
+        results.append({'fixture': fixture, 'target_km': None, 'stage': "build", 'seconds': build_seconds})
+
+        # Wczytanie z magazynu grafów - tak jak przy każdym zapytaniu o nowy obszar.
+        # Dalsze etapy liczone są na grafie z magazynu (z tablicami gotowymi od razu)
+        key = f"bench_{fixture}"
+        store_dir = tempfile.mkdtemp(prefix="bench_store_")
+        save_graph_to_store(G, key, store_dir=store_dir)
+        G, load_seconds = _time_stage(lambda: load_graph_from_store(key, store_dir), repeat,
+                                      setup=lambda: _loaded_graphs.pop(key, None))
+        results.append({'fixture': fixture, 'target_km': None, 'stage': "load", 'seconds': load_seconds})
+        print(f"{fixture}: {len(G)} węzłów, {G.number_of_edges()} krawędzi, zbudowano w {build_seconds:.2f} s, "
+              f"wczytano z magazynu w {load_seconds:.2f} s", file=sys.stderr)
+
+        # Start w środku grafu
+        _, coords = get_node_coordinates(G)
+        start_lon, start_lat = (float(v) for v in coords.mean(axis=0))
+
+        for target_km in targets_km:
+            stages = benchmark_route_stages(G, start_lon, start_lat, target_km, repeat, memory)
+            for stage, record in stages.items():
+                results.append(dict({'fixture': fixture, 'target_km': target_km, 'stage': stage}, **record))
+            print(f"{fixture} {target_km} km: " +
+                  ", ".join(f"{stage} {record['seconds']*1000:.1f} ms" for stage, record in stages.items()),
+                  file=sys.stderr)
+
+        _loaded_graphs.pop(key, None)
+        del G
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'osmnx': ox.__version__,
+            'networkx': nx.__version__,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+def compare_benchmarks(current: Dict, baseline: Dict, threshold: float = 0.2,
+                       min_seconds: float = 0.001) -> List[Dict]:
+    """
+    Zwraca etapy, które są wolniejsze od wyników bazowych o więcej niż threshold (np. 0.2 = 20%).
+    Różnice mniejsze niż min_seconds są pomijane - przy bardzo krótkich etapach to tylko szum.
+    """
+    def key(record):
+        return record['fixture'], record['target_km'], record['stage']
+
+    baseline_seconds = {key(record): record['seconds'] for record in baseline['results']}
+    regressions = []
+    for record in current['results']:
+        before = baseline_seconds.get(key(record))
+        if before and record['seconds'] > before * (1 + threshold) and record['seconds'] - before > min_seconds:
+            regressions.append(dict(record, baseline_seconds=before, ratio=record['seconds'] / before))
+    return regressions
+
+def run_bench_command(args) -> int:
+    report = run_benchmarks(args.fixtures.split(","), [float(t) for t in args.targets.split(",")],
+                            args.repeat, not args.no_memory)
+
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w", encoding='utf-8') as f:
+            f.write(text)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, "r", encoding='utf-8') as f:
+        regressions = compare_benchmarks(report, json.load(f), args.threshold)
+    for record in regressions:
+        target = f" {record['target_km']} km" if record['target_km'] is not None else ""
+        print(f"Regresja: {record['fixture']}{target} {record['stage']}: "
+              f"{record['baseline_seconds']*1000:.1f} ms -> {record['seconds']*1000:.1f} ms", file=sys.stderr)
+    return 1 if regressions else 0
+
+def main(region: str = None, workers: int = 1, use_alt: bool = False, search: str = "adaptive",
+         bike_type: str = None, output_format: str = "geojson", precision: int = GEOJSON_PRECISION):
     # Pobierz dane od użytkownika
     target_route_length, start_lon, start_lat = get_user_input()
 
@@ -529,61 +3160,172 @@ def main():
 Docelowa długość trasy: {target_route_length/1000:.1f} km")
     
     # Definiujemy różne proporcje do przetestowania
-    proportions = [
-        (7.0, "10:7"),
-        (6.5, "10:6.5"), 
-        (6.0, "10:6")
-    ]
+    proportions = DEFAULT_PROPORTIONS
     
     # Oblicz promień obszaru do pobrania (używamy największego możliwego kwadratu dla bezpieczeństwa)
-    max_side_length = calculate_square_dimensions(target_route_length, min(p[0] for p in proportions))[1]
-    area_radius = max_side_length * 1.5  # 50% zapasu
+    area_radius = calculate_search_radius(target_route_length, proportions)
 
     print(f"
 Ładowanie mapy dróg rowerowych (promień: {area_radius/1000:.1f} km)...")
     try:
-        G = ox.graph_from_point((start_lat, start_lon), dist=area_radius, network_type="bike")
+        G = load_graph_for_area(start_lat, start_lon, area_radius, region=region, network_type="bike")
         print(f"Załadowano graf z {len(G.nodes())} węzłami i {len(G.edges())} krawędziami")
+        if overpass_cache.hits or overpass_cache.misses:
+            print_overpass_cache_stats()
+        if use_alt:
+            get_alt_index(G, build=True)
     except Exception as e:
         print(f"Błąd ładowania mapy: {e}")
         return
 
     # Generuj trasy dla wszystkich proporcji
-    all_results = []
-    
-    for proportion_denominator, proportion_name in proportions:
-        result = generate_route_for_proportion(
-            G, start_lon, start_lat, target_route_length, 
-            proportion_denominator, proportion_name
-        )
-        all_results.append(result)
+    all_results = search_routes(G, start_lon, start_lat, target_route_length, search, workers, bike_type)
 
     # Porównaj wyniki i wybierz najlepszy
     best_result = print_comparison_table(all_results, target_route_length)
     
     if best_result:
         # Zapisz najlepszą trasę
-        output_file = save_best_route(best_result, start_lon, start_lat, all_results)
+        output_file = save_best_route(G, best_result, start_lon, start_lat, all_results, output_format, precision)
         
         print(f"
 === PODSUMOWANIE ===")
-        print(f"NAJLEPSZA PROPORCJA: 10:{best_result['proportion_denominator']}")
+        print(f"NAJLEPSZA PROPORCJA: {best_result.proportion_name}")
         print(f"Docelowa długość trasy: {target_route_length/1000:.1f} km")
-        print(f"Rzeczywista długość trasy: {best_result['actual_length']/1000:.1f} km")
-        print(f"Różnica: {best_result['length_difference']/1000:.1f} km ({best_result['length_difference_percent']:.1f}%)")
-        print(f"Obwód kwadratu (teoretyczny): {best_result['square_perimeter']/1000:.1f} km")
-        print(f"Długość boku kwadratu: {best_result['side_length']:.0f} m")
+        print(f"Rzeczywista długość trasy: {best_result.actual_length/1000:.1f} km")
+        print(f"Różnica: {best_result.length_difference/1000:.1f} km ({best_result.length_difference_percent:.1f}%)")
+        print(f"Obwód kwadratu (teoretyczny): {best_result.square_perimeter/1000:.1f} km")
+        print(f"Długość boku kwadratu: {best_result.side_length:.0f} m")
+        if bike_type:
+            verdict = "NIE jest odpowiednia" if best_result.disallowed_surfaces else "jest odpowiednia"
+            print(f"Trasa {verdict} dla roweru typu: {bike_type}")
         print(f"Plik wynikowy: {output_file}")
     else:
         print("
 Nie udało się wygenerować żadnej trasy. Spróbuj zmienić parametry.")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generator okrężnych tras rowerowych")
+    parser.add_argument("--region", default=None,
+                        help="Nazwa grafu regionalnego, z którego wycinany jest podgraf zapytania")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Liczba procesów liczących równolegle kształty (--search adaptive) "
+                             "albo proporcje (--search fixed); dla serve - procesów obsługujących "
+                             "zapytania (domyślnie 1, dla serve liczba procesorów)")
+    parser.add_argument("--alt", action="store_true",
+                        help="Zbuduj (raz na graf w magazynie) i używaj indeksu ALT do wyszukiwania ścieżek")
+    parser.add_argument("--search", choices=["adaptive", "fixed"], default="adaptive",
+                        help="Adaptacyjny dobór kształtu i skali albo stałe proporcje 10:7 / 10:6.5 / 10:6")
+    parser.add_argument("--bike-type", choices=list(bike_surface_rules), default=None,
+                        help="Typ roweru - trasa omija nawierzchnie dla niego niedozwolone")
+    parser.add_argument("--output-format", choices=list(OUTPUT_FORMATS), default="geojson",
+                        help="Format pliku z najlepszą trasą (geojsonseq = RFC 8142, fgb = FlatGeobuf)")
+    parser.add_argument("--precision", type=int, default=GEOJSON_PRECISION,
+                        help="Liczba miejsc po przecinku we współrzędnych GeoJSON")
+    parser.add_argument("--trace", default=None,
+                        help="Zapisuj czasy etapów (spans) do pliku JSONL")
+    parser.add_argument("--profile", default=None,
+                        help="Uruchom pod cProfile i zapisz statystyki do pliku .prof")
+    subparsers = parser.add_subparsers(dest="command")
+
+    store_parser = subparsers.add_parser("graph-store", help="Zarządzanie lokalnym magazynem grafów")
+    store_parser.add_argument("action", choices=["list", "invalidate", "refresh"])
+    store_parser.add_argument("--key", default=None, help="Klucz regionu (domyślnie wszystkie wpisy)")
+
+    region_parser = subparsers.add_parser("region", help="Budowanie grafu regionalnego z indeksem kafelków")
+    region_parser.add_argument("name", help="Nazwa regionu, np. slask")
+    region_parser.add_argument("--place", required=True, help='Zapytanie do OSM, np. "Województwo śląskie, Polska"')
+
+    bench_parser = subparsers.add_parser("bench", help="Testy wydajności na stałych grafach (bez sieci)")
+    bench_parser.add_argument("--fixtures", default="chorzow,grid", help="Grafy testowe: chorzow, grid")
+    bench_parser.add_argument("--targets", default=",".join(str(t) for t in BENCH_TARGETS_KM),
+                              help="Długości tras w km, np. 5,10,20")
+    bench_parser.add_argument("--repeat", type=int, default=3, help="Liczba powtórzeń (brany jest najlepszy czas)")
+    bench_parser.add_argument("--no-memory", action="store_true", help="Bez pomiaru szczytowej pamięci")
+    bench_parser.add_argument("--output", default="-", help="Plik wynikowy JSON lub - dla stdout")
+    bench_parser.add_argument("--baseline", default=None, help="Wyniki bazowe JSON do porównania")
+    bench_parser.add_argument("--threshold", type=float, default=0.2,
+                              help="Dopuszczalne spowolnienie względem wyników bazowych (0.2 = 20%%)")
+
+    cache_parser = subparsers.add_parser("overpass-cache", help="Pamięć podręczna odpowiedzi Overpass")
+    cache_parser.add_argument("action", choices=["stats", "prune", "clear"])
+
+    ingest_parser = subparsers.add_parser("ingest", help="Budowanie grafu regionalnego z lokalnego wyciągu OSM (bez sieci)")
+    ingest_parser.add_argument("path", help="Plik .osm, .osm.bz2, .osm.gz lub .osm.pbf")
+    ingest_parser.add_argument("--name", required=True, help="Nazwa regionu, np. slask")
+
+    batch_parser = subparsers.add_parser("batch", help="Generowanie tras dla wielu zadań z pliku CSV/JSONL")
+    batch_parser.add_argument("--input", default="-", help="Plik z zadaniami (start_lon, start_lat, target_km) lub - dla stdin")
+    batch_parser.add_argument("--output", default="-", help="Plik wynikowy JSONL lub - dla stdout")
+
+    serve_parser = subparsers.add_parser("serve", help="Serwer HTTP z trasami okrężnymi i z punktu do punktu")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+
+    return parser.parse_args()
+
+def run_graph_store_command(args):
+    if args.action == "list":
+        for entry in list_graph_store():
+            print(f"{entry['key']}: {entry['node_count']} węzłów, {entry['edge_count']} krawędzi")
+    elif args.action == "invalidate":
+        removed = invalidate_graph_store(args.key)
+        print(f"Usunięto wpisów: {removed}")
+    elif args.action == "refresh":
+        refreshed = refresh_graph_store(args.key)
+        print(f"Odświeżono wpisów: {refreshed}")
+
+def run_overpass_cache_command(args):
+    if args.action == "prune":
+        print(f"Usunięto plików: {overpass_cache.prune()}")
+    elif args.action == "clear":
+        print(f"Usunięto plików: {overpass_cache.clear()}")
+    print_overpass_cache_stats()
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    profiler.enabled = bool(args.trace)
+    cli_profile = cProfile.Profile() if args.profile else None
+    if cli_profile:
+        cli_profile.enable()
+    try:
+        if args.command == "graph-store":
+            run_graph_store_command(args)
+        elif args.command == "region":
+            build_regional_graph(args.name, args.place)
+        elif args.command == "ingest":
+            ingest_osm_extract(args.path, args.name)
+        elif args.command == "overpass-cache":
+            run_overpass_cache_command(args)
+        elif args.command == "bench":
+            sys.exit(run_bench_command(args))
+        elif args.command == "batch":
+            run_batch(args.input, args.output, region=args.region, workers=args.workers or 1, use_alt=args.alt,
+                      search=args.search, bike_type=args.bike_type)
+        elif args.command == "serve":
+            asyncio.run(serve_routes(args.host, args.port, workers=args.workers, region=args.region, trace=args.trace))
+        else:
+            main(region=args.region, workers=args.workers or 1, use_alt=args.alt, search=args.search,
+                 bike_type=args.bike_type, output_format=args.output_format, precision=args.precision)
+    finally:
+        if cli_profile:
+            cli_profile.disable()
+            cli_profile.dump_stats(args.profile)
+        if args.trace and args.command != "serve":
+            profiler.write_trace(args.trace, command=args.command or "route")
+
 ----------------------------------------------------------------------------------------------------------------------------
 
 import json
-from typing import List, Tuple
+import random
+import sys
+import time
+import tracemalloc
+from collections import deque
+from typing import List, Tuple, Dict, Iterable, Iterator
+
+# Jak daleko (w punktach) może leżeć powrót do tego samego miejsca, żeby uznać go za backtracking
+BACKTRACK_WINDOW = 15
 
 def remove_duplicate_coordinates(geojson_data: dict) -> dict:
     """
@@ -595,72 +3337,104 @@ def remove_duplicate_coordinates(geojson_data: dict) -> dict:
     cleaned_features = []
     
     for feature in geojson_data["features"]:
-        if feature["geometry"]["type"] == "LineString":
-            # Czyszczenie współrzędnych dla LineString
-            coordinates = feature["geometry"]["coordinates"]
-            cleaned_coords = clean_line_coordinates(coordinates)
-            feature["geometry"]["coordinates"] = cleaned_coords
-            
-        elif feature["geometry"]["type"] == "MultiLineString":
-            # Czyszczenie współrzędnych dla MultiLineString
-            cleaned_lines = []
-            for line in feature["geometry"]["coordinates"]:
-                cleaned_line = clean_line_coordinates(line)
-                cleaned_lines.append(cleaned_line)
-            feature["geometry"]["coordinates"] = cleaned_lines
-        
+        clean_feature(feature)
         cleaned_features.append(feature)
     
     geojson_data["features"] = cleaned_features
     return geojson_data
 
-def clean_line_coordinates(coordinates: List[List[float]]) -> List[List[float]]:
+def clean_feature(feature: dict) -> Tuple[int, int]:
+    """
+    Czyści geometrię jednego obiektu (w miejscu).
+    Zwraca liczbę współrzędnych linii przed i po czyszczeniu.
+    """
+    geometry = feature["geometry"]
+    
+    if geometry["type"] == "LineString":
+        # Czyszczenie współrzędnych dla LineString
+        coordinates = geometry["coordinates"]
+        geometry["coordinates"] = clean_line_coordinates(coordinates)
+        return len(coordinates), len(geometry["coordinates"])
+    
+    if geometry["type"] == "MultiLineString":
+        # Czyszczenie współrzędnych dla MultiLineString
+        before = sum(len(line) for line in geometry["coordinates"])
+        geometry["coordinates"] = [clean_line_coordinates(line) for line in geometry["coordinates"]]
+        return before, sum(len(line) for line in geometry["coordinates"])
+    
+    return 0, 0
+
+def clean_line_coordinates(coordinates: List[List[float]], issues: List[Dict] = None) -> List[List[float]]:
     """
     Czyści współrzędne linii usuwając duplikaty i backtracking.
     """
     if not coordinates:
         return coordinates
     
-    # Krok 1: Usuń bezpośrednie duplikaty
-    cleaned = [coordinates[0]]
-    for i in range(1, len(coordinates)):
-        if coordinates[i] != coordinates[i-1]:
-            cleaned.append(coordinates[i])
-    
-    # Krok 2: Usuń backtracking (A→B→A)
-    final_cleaned = remove_backtracking(cleaned)
-    
-    return final_cleaned
+    return list(iter_clean_coordinates(coordinates, issues=issues))
 
-def remove_backtracking(coordinates: List[List[float]]) -> List[List[float]]:
+def remove_backtracking(coordinates: List[List[float]], issues: List[Dict] = None) -> List[List[float]]:
     """
     Usuwa backtracking (fragmenty gdzie wracamy tą samą drogą).
     """
     if len(coordinates) < 3:
         return coordinates
     
-    i = 0
-    result = []
-    
-    while i < len(coordinates):
-        result.append(coordinates[i])
-        
-        # Sprawdź czy następne punkty tworzą backtracking
-        found_backtrack = False
-        
-        # Szukaj wzorca A→B→A
-        for j in range(i + 2, min(i + 15, len(coordinates))):  # Sprawdzaj do 15 punktów do przodu
-            if coordinates[i] == coordinates[j]:
-                # Znaleziono backtracking - pomiń punkty od i+1 do j
-                print(f"Znaleziono backtracking: pomijam {j-i-1} punktów między pozycją {i+1} a {j}")
-                i = j
-                found_backtrack = True
-                break
-        
-        if not found_backtrack:
-            i += 1
-    
-    return result
+    return list(iter_clean_coordinates(coordinates, issues=issues))
+
+def iter_clean_coordinates(coordinates: Iterable, window: int = BACKTRACK_WINDOW,
+                           issues: List[Dict] = None) -> Iterator:
+    """
+    Strumieniowo czyści punkty linii w jednym przejściu: pomija bezpośrednie duplikaty
+    i wycina pętle A→...→A krótsze niż window punktów.
+    Mapa ostatnich pozycji punktów pozwala wykryć powrót bez porównywania okna punkt po punkcie,
+    a w pamięci trzymane jest tylko ostatnie window punktów - resztę od razu oddajemy.
+    Znalezione problemy są dopisywane do listy issues (jeśli podano).
+    """
+    buffer = deque()  # (pozycja po usunięciu duplikatów, pozycja w wejściu, punkt)
+    last_seen = {}    # punkt -> pozycja po usunięciu duplikatów (tylko punkty w buforze)
+    previous = None
+    position = -1
+
+    for index, point in enumerate(coordinates):
+        key = tuple(point)
+
+        # Krok 1: bezpośredni duplikat
+        if key == previous:
+            if issues is not None:
+                issues.append({"type": "duplicate", "start": index - 1, "end": index, "coordinate": point})
+            continue
+        previous = key
+        position += 1
+
+        # Krok 2: backtracking - wracamy do punktu, który jest jeszcze w buforze
+        seen_at = last_seen.get(key)
+        if seen_at is not None and position - seen_at < window:
+            removed = 0
+            while buffer[-1][0] != seen_at:
+                popped_position, _, popped_point = buffer.pop()
+                popped_key = tuple(popped_point)
+                if last_seen.get(popped_key) == popped_position:
+                    del last_seen[popped_key]
+                removed += 1
+            if issues is not None:
+                issues.append({"type": "backtracking", "start": buffer[-1][1], "end": index,
+                               "removed": removed, "coordinate": point})
+            continue
+
+        buffer.append((position, index, point))
+        last_seen[key] = position
+
+        # Punkty starsze niż okno nie mogą już zostać usunięte
+        while buffer[0][0] <= position - window:
+            old_position, _, old_point = buffer.popleft()
+            old_key = tuple(old_point)
+            if last_seen.get(old_key) == old_position:
+                del last_seen[old_key]
+            yield old_point
+
+    for _, _, point in buffer:
+        yield point
 
 def analyze_geojson_issues(geojson_data: dict) -> dict:
     """
@@ -690,31 +3464,196 @@ def analyze_geojson_issues(geojson_data: dict) -> dict:
                 feature_issues = analyze_line_issues(coords)
                 if feature_issues:
                     issues["issues_found"].extend(feature_issues)
-                    issues["duplicate_segments"] += len([i for i in feature_issues if "duplicate" in i])
-                    issues["backtracking_segments"] += len([i for i in feature_issues if "backtracking" in i])
+                    issues["duplicate_segments"] += len([i for i in feature_issues if i["type"] == "duplicate"])
+                    issues["backtracking_segments"] += len([i for i in feature_issues if i["type"] == "backtracking"])
     
     return issues
 
-def analyze_line_issues(coordinates: List[List[float]]) -> List[str]:
+def analyze_line_issues(coordinates: List[List[float]]) -> List[Dict]:
     """
     Analizuje linię pod kątem problemów.
+    Zwraca rekordy {"type", "start", "end", "coordinate"}.
     """
     issues = []
     
     # Sprawdź bezpośrednie duplikaty
     for i in range(1, len(coordinates)):
         if coordinates[i] == coordinates[i-1]:
-            issues.append(f"Duplicate at position {i-1}-{i}: {coordinates[i]}")
+            issues.append({"type": "duplicate", "start": i - 1, "end": i, "coordinate": coordinates[i]})
     
-    # Sprawdź backtracking
+    # Następne wystąpienie tego samego punktu - jedno przejście od końca
+    next_same = [None] * len(coordinates)
+    last_seen = {}
+    for i in range(len(coordinates) - 1, -1, -1):
+        key = tuple(coordinates[i])
+        next_same[i] = last_seen.get(key)
+        last_seen[key] = i
+    
+    # Sprawdź backtracking (pierwszy powrót co najmniej 2 punkty dalej, w oknie BACKTRACK_WINDOW)
     for i in range(len(coordinates) - 2):
-        for j in range(i + 2, min(i + 15, len(coordinates))):
-            if coordinates[i] == coordinates[j]:
-                issues.append(f"Backtracking from {i} to {j}: {coordinates[i]}")
-                break
+        j = next_same[i]
+        if j == i + 1:
+            j = next_same[j]
+        if j is not None and j < i + BACKTRACK_WINDOW:
+            issues.append({"type": "backtracking", "start": i, "end": j, "coordinate": coordinates[i]})
     
     return issues
 
+def format_issue(issue: Dict) -> str:
+    """
+    Opis problemu do wyświetlenia.
+    """
+    if issue["type"] == "duplicate":
+        return f"Duplicate at position {issue['start']}-{issue['end']}: {issue['coordinate']}"
+    return f"Backtracking from {issue['start']} to {issue['end']}: {issue['coordinate']}"
+
+# Strumieniowe czytanie i zapis GeoJSON - w pamięci jest tylko jeden obiekt (feature) naraz
+READ_CHUNK_SIZE = 1 << 16
+JSON_NUMBER_START = "-0123456789"
+JSON_VALUE_END = " \t\r\n,]}"
+
+def iter_geojson_events(input_file: str) -> Iterator[Tuple]:
+    """
+    Czyta obiekt GeoJSON kawałkami i zwraca zdarzenia:
+    ("member", klucz, wartość) dla pól najwyższego poziomu,
+    ("features_start",) / ("feature", obiekt) / ("features_end",) dla tablicy features.
+    """
+    decoder = json.JSONDecoder()
+
+    with open(input_file, 'r', encoding='utf-8') as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill(size: int = READ_CHUNK_SIZE) -> bool:
+            nonlocal buffer, pos, eof
+            if eof:
+                return False
+            chunk = f.read(max(size, READ_CHUNK_SIZE))
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def next_char() -> str:
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if not fill():
+                    raise ValueError("Nieoczekiwany koniec pliku GeoJSON")
+
+        def expect(char: str):
+            nonlocal pos
+            if next_char() != char:
+                raise ValueError(f"Niepoprawny GeoJSON: oczekiwano '{char}' na pozycji {pos}")
+            pos += 1
+
+        def decode():
+            nonlocal pos
+            next_char()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # Ucięta liczba też jest poprawna ("12" z "1234", "-12.5" z "-12.5e3") - jest
+                    # kompletna dopiero, gdy za nią stoi separator. Pozostałe wartości mają własny koniec
+                    truncated = (buffer[pos] in JSON_NUMBER_START and
+                                 (end == len(buffer) or buffer[end] not in JSON_VALUE_END))
+                    if not truncated or not fill():
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    # Niedoczytana wartość jest parsowana od początku - bufor rośnie co najmniej
+                    # dwukrotnie, więc łączny koszt dla dużego obiektu pozostaje liniowy
+                    if not fill(len(buffer) - pos):
+                        raise
+
+        expect('{')
+        while next_char() != '}':
+            if buffer[pos] == ',':
+                pos += 1
+            key = decode()
+            expect(':')
+
+            if key != "features":
+                yield ("member", key, decode())
+                continue
+
+            expect('[')
+            yield ("features_start",)
+            while next_char() != ']':
+                if buffer[pos] == ',':
+                    pos += 1
+                yield ("feature", decode())
+            pos += 1
+            yield ("features_end",)
+
+def stream_clean_geojson(input_file: str, output_file: str, analyze: bool = False,
+                         max_reported_issues: int = 10) -> Dict:
+    """
+    Czyści plik GeoJSON strumieniowo: wczytuje po jednym obiekcie, czyści linie
+    i od razu dopisuje go w zwartej postaci do pliku wyjściowego.
+    Zwraca raport z liczbą współrzędnych, problemów i przepustowością (obiekty/s).
+    """
+    report = {
+        "total_features": 0,
+        "line_features": 0,
+        "duplicate_segments": 0,
+        "backtracking_segments": 0,
+        "total_coordinates_before": 0,
+        "total_coordinates_after": 0,
+        "issues_found": [],
+        "features_per_second": 0.0,
+    }
+    start_time = time.perf_counter()
+
+    def dumps(value) -> str:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+    with open(output_file, 'w', encoding='utf-8') as out:
+        out.write("{")
+        members_written = 0
+        first_feature = True
+
+        for event in iter_geojson_events(input_file):
+            if event[0] == "member":
+                out.write(("," if members_written else "") + dumps(event[1]) + ":" + dumps(event[2]))
+                members_written += 1
+            elif event[0] == "features_start":
+                out.write(("," if members_written else "") + '"features":[')
+                members_written += 1
+            elif event[0] == "features_end":
+                out.write("]")
+            else:
+                feature = event[1]
+                report["total_features"] += 1
+
+                if analyze and feature["geometry"]["type"] == "LineString":
+                    feature_issues = analyze_line_issues(feature["geometry"]["coordinates"])
+                    report["duplicate_segments"] += len([i for i in feature_issues if i["type"] == "duplicate"])
+                    report["backtracking_segments"] += len([i for i in feature_issues if i["type"] == "backtracking"])
+                    free_slots = max_reported_issues - len(report["issues_found"])
+                    report["issues_found"].extend(feature_issues[:max(free_slots, 0)])
+
+                before, after = clean_feature(feature)
+                if feature["geometry"]["type"] in ["LineString", "MultiLineString"]:
+                    report["line_features"] += 1
+                report["total_coordinates_before"] += before
+                report["total_coordinates_after"] += after
+
+                out.write(("" if first_feature else ",") + dumps(feature))
+                first_feature = False
+
+        out.write("}")
+
+    elapsed = time.perf_counter() - start_time
+    report["features_per_second"] = report["total_features"] / elapsed if elapsed > 0 else 0.0
+    return report
+
 def clean_best_circular_route():
     """
     Czyści konkretny plik 'best_circular_route.geojson'
@@ -723,43 +3662,34 @@ def clean_best_circular_route():
     output_file = "best_circular_route_cleaned.geojson"
     
     try:
-        # Wczytaj plik
+        # Wczytaj, przeanalizuj i wyczyść plik w jednym przejściu strumieniowym
         print(f"Wczytywanie pliku: {input_file}")
-        with open(input_file, 'r', encoding='utf-8') as f:
-            geojson_data = json.load(f)
+        report = stream_clean_geojson(input_file, output_file, analyze=True)
         
-        # Analizuj problemy przed czyszczeniem
+        # Problemy znalezione przed czyszczeniem
         print("
 === ANALIZA PROBLEMÓW ===")
-        issues_before = analyze_geojson_issues(geojson_data)
-        print(f"Znalezione problemy: {len(issues_before['issues_found'])}")
+        issues_count = report['duplicate_segments'] + report['backtracking_segments']
+        print(f"Znalezione problemy: {issues_count}")
         
-        if issues_before['issues_found']:
-            for issue in issues_before['issues_found'][:10]:  # Pokaz pierwsze 10 problemów
-                print(f"  - {issue}")
-            if len(issues_before['issues_found']) > 10:
-                print(f"  ... i {len(issues_before['issues_found']) - 10} więcej")
+        if issues_count:
+            for issue in report['issues_found']:  # Pokaz pierwsze 10 problemów
+                print(f"  - {format_issue(issue)}")
+            if issues_count > len(report['issues_found']):
+                print(f"  ... i {issues_count - len(report['issues_found'])} więcej")
         else:
             print("  Brak znalezionych problemów!")
         
-        # Wyczyść dane
         print("
 === CZYSZCZENIE DANYCH ===")
-        cleaned_geojson = remove_duplicate_coordinates(geojson_data)
-        
-        # Analizuj po czyszczeniu
-        issues_after = analyze_geojson_issues(cleaned_geojson)
-        
-        # Zapisz wyczyszczony plik
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(cleaned_geojson, f, ensure_ascii=False, indent=2)
+        print(f"Przetworzono {report['total_features']} obiektów ({report['features_per_second']:.0f} obiektów/s)")
         
         # Raport
         print("
 === RAPORT ===")
-        print(f"Przed czyszczeniem: {issues_before['total_coordinates_before']} współrzędnych")
-        print(f"Po czyszczeniu: {issues_after['total_coordinates_before']} współrzędnych")
-        removed_count = issues_before['total_coordinates_before'] - issues_after['total_coordinates_before']
+        print(f"Przed czyszczeniem: {report['total_coordinates_before']} współrzędnych")
+        print(f"Po czyszczeniu: {report['total_coordinates_after']} współrzędnych")
+        removed_count = report['total_coordinates_before'] - report['total_coordinates_after']
         print(f"Usunięto: {removed_count} powtórzonych współrzędnych")
         print(f"Plik wyjściowy: {output_file}")
         
@@ -771,7 +3701,7 @@ def clean_best_circular_route():
         except ImportError:
             print("Uruchomiono poza Colab - plik zapisany lokalnie")
         
-        return cleaned_geojson
+        return report
         
     except FileNotFoundError:
         print(f"Błąd: Nie znaleziono pliku {input_file}")
@@ -790,15 +3720,10 @@ def quick_clean_geojson():
     output_file = "best_circular_route_cleaned.geojson"
     
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            geojson_data = json.load(f)
-        
-        cleaned_data = remove_duplicate_coordinates(geojson_data)
-        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(cleaned_data, f, ensure_ascii=False, indent=2)
+        report = stream_clean_geojson(input_file, output_file)
         
         print(f"Plik wyczyszczony i zapisany jako: {output_file}")
+        print(f"Przetworzono {report['total_features']} obiektów ({report['features_per_second']:.0f} obiektów/s)")
         
         # Pobierz w Colab
         try:
@@ -807,16 +3732,75 @@ def quick_clean_geojson():
         except ImportError:
             pass
             
-        return cleaned_data
+        return report
         
     except Exception as e:
         print(f"Błąd: {e}")
         return None
 
+# Test wydajności czyszczenia na długim, sztucznym śladzie (python skrypt.py bench)
+BENCH_TRACK_POINTS = 200_000
+
+def synthetic_track(points: int = BENCH_TRACK_POINTS, seed: int = 0) -> List[List[float]]:
+    """
+    Powtarzalny ślad po siatce ok. 10 m z wtrąconymi duplikatami i krótkimi nawrotami (A→...→A).
+    """
+    rng = random.Random(seed)
+    lon, lat = 18.9, 50.25
+    heading = (1, 0)
+    coordinates = []
+    while len(coordinates) < points:
+        if rng.random() < 0.1:
+            heading = rng.choice([(heading[1], heading[0]), (-heading[1], -heading[0])])  # skręt w lewo/prawo
+        lon += heading[0] * 0.00014
+        lat += heading[1] * 0.00009
+        coordinates.append([round(lon, 6), round(lat, 6)])
+        roll = rng.random()
+        if roll < 0.05:
+            coordinates.append(coordinates[-1])
+        elif roll < 0.08:
+            # Wjazd w ślepą uliczkę i powrót tą samą drogą
+            spur = [[round(lon + step * 0.00014, 6), round(lat, 6)] for step in range(1, rng.randint(2, 6))]
+            coordinates.extend(spur + spur[-2::-1] + [[round(lon, 6), round(lat, 6)]])
+    return coordinates[:points]
+
+def benchmark_cleaning(points: int = BENCH_TRACK_POINTS, repeat: int = 3) -> List[Dict]:
+    """
+    Mierzy remove_backtracking i strumieniowe iter_clean_coordinates (najlepszy czas z repeat
+    wywołań i szczytowa pamięć). Rekordy mają ten sam format co w teście wydajności tras.
+    """
+    coordinates = synthetic_track(points)
+    stages = {
+        "remove_backtracking": lambda: remove_backtracking(coordinates),
+        "iter_clean_coordinates": lambda: sum(1 for _ in iter_clean_coordinates(iter(coordinates))),
+    }
+
+    records = []
+    for stage, fn in stages.items():
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - started)
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        records.append({'fixture': f"track_{points}", 'target_km': None, 'stage': stage,
+                        'seconds': best, 'peak_bytes': peak_bytes})
+        print(f"{stage}: {points} punktów w {best*1000:.1f} ms "
+              f"({points / best:.0f} punktów/s)", file=sys.stderr)
+    return records
+
 # Uruchom czyszczenie
 if __name__ == "__main__":
-    # Użyj tej funkcji w Colab:
-    clean_best_circular_route()
+    if sys.argv[1:2] == ["bench"]:
+        print(json.dumps({'results': benchmark_cleaning()}, ensure_ascii=False, indent=1))
+    else:
+        # Użyj tej funkcji w Colab:
+        clean_best_circular_route()
     
 ------------------------------------------------------------------------------------
 